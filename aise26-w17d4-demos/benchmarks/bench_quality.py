@@ -0,0 +1,69 @@
+"""
+Image quality feature benchmark
+
+Times image_quality on its two stages: reducing an image to a small
+grayscale copy (draft-mode JPEG decode from disk, or resize of an array
+that is already decoded) and computing the feature matrix for a batch.
+Both are reported per image; together they should stay within a few ms.
+
+Usage:
+    python benchmarks/bench_quality.py
+    python benchmarks/bench_quality.py --batch 256 --repeats 20
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "demos"))
+from image_quality import FEATURES, load_gray, quality_features  # noqa: E402
+
+IMAGE_DIR = Path(__file__).resolve().parent.parent / "data" / "images"
+
+
+def time_per_item_ms(fn, items, repeats):
+    """Median over `repeats` runs of fn(items), divided by len(items)."""
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(items)
+        latencies.append((time.perf_counter() - start) * 1000 / len(items))
+    return float(np.median(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image quality feature benchmark")
+    parser.add_argument("--batch", type=int, default=64, help="Images per feature batch")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    paths = sorted(IMAGE_DIR.glob("*.jpg"))
+    if not paths:
+        sys.exit(f"No sample images in {IMAGE_DIR}")
+
+    arrays = [np.asarray(Image.open(p).convert("RGB")) for p in paths]
+    gray = np.stack([load_gray(p) for p in paths])
+    batch = gray[np.arange(args.batch) % len(gray)]
+
+    print(f"{len(paths)} sample images, feature batch of {args.batch} (ms per image)\n")
+
+    load_path_ms = time_per_item_ms(lambda items: [load_gray(p) for p in items], paths, args.repeats)
+    load_array_ms = time_per_item_ms(lambda items: [load_gray(a) for a in items], arrays, args.repeats)
+    features_ms = time_per_item_ms(quality_features, batch, args.repeats)
+
+    print(f"{'reduce from path (draft decode)':34s} {load_path_ms:8.3f}")
+    print(f"{'reduce from decoded array':34s} {load_array_ms:8.3f}")
+    print(f"{'features (batched)':34s} {features_ms:8.3f}")
+    print(f"{'total from path':34s} {load_path_ms + features_ms:8.3f}")
+
+    print(f"\n{'image':24s} " + " ".join(f"{name:>12s}" for name in FEATURES))
+    for path, row in zip(paths, quality_features(gray)):
+        print(f"{path.name:24s} " + " ".join(f"{value:12.3f}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Benchmark suite for the three demo pipelines
+
+Micro and macro benchmarks with a common report format:
+
+- index:      CLIPRetriever.index_images over a directory of synthetic images
+- search:     CLIPRetriever.search_batch (one query, cache misses) against
+              synthetic galleries of several sizes
+- caption:    ImageCaptioner.caption_image
+- transcribe: AudioTranscriber.transcribe_audio on synthetic clips
+- speech:     AudioTranscriber.transcribe_speech (VAD + packed windows)
+              against transcribing the whole waveform, on a synthetic
+              clip of speech-like bursts separated by silence
+
+Each benchmark reports p50/p95/p99/mean latency in ms, throughput
+(items/sec) and peak RSS. Every benchmark runs in its own spawned
+process, so its peak RSS is not inflated by the benchmarks before it
+(results of one benchmark, e.g. the search gallery sizes, share their
+process). Results are written as
+JSON and can be compared against a saved baseline; regressions beyond
+--tolerance are flagged (and fail the run with --fail-on-regression).
+
+By default the models are tiny randomly initialized checkpoints built
+on the fly (see tiny_models.py), so the suite runs offline in seconds.
+Use --models pretrained to benchmark the real checkpoints.
+
+Usage:
+    python benchmarks/bench_suite.py --output outputs/bench.json
+    python benchmarks/bench_suite.py --baseline outputs/bench.json --fail-on-regression
+    python benchmarks/bench_suite.py --models pretrained --only caption transcribe
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib
+import contextlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+import torch
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "demos"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from tiny_models import build_tiny_models  # noqa: E402
+
+BENCHMARKS = ("index", "search", "caption", "transcribe", "speech")
+PRETRAINED = {
+    "clip": "openai/clip-vit-base-patch32",
+    "blip": "Salesforce/blip-image-captioning-base",
+    "whisper": "openai/whisper-tiny",
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    # On Linux, ru_maxrss of a spawned process also counts the parent's RSS
+    # at fork time; VmHWM only covers this process image
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies_s, items_per_call=1):
+    """Latency percentiles (ms), throughput and peak RSS for one benchmark."""
+    ms = np.array(latencies_s) * 1000
+    return {
+        "runs": len(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "throughput_per_s": float(items_per_call * len(ms) / (ms.sum() / 1000)),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def timed(fn, repeats, warmup=1):
+    """Call fn() `warmup` times untimed, then `repeats` times; return latencies (s)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            fn()
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def make_images(directory, count, size=256, seed=0):
+    """Write `count` random JPEGs; return their paths."""
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        pixels = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+        path = directory / f"img_{i:04d}.jpg"
+        Image.fromarray(pixels).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def make_clips(directory, count, seconds=5.0, sr=16000, seed=0):
+    """Write `count` synthetic speech-like WAVs (modulated tones + noise)."""
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    t = np.arange(int(seconds * sr)) / sr
+    paths = []
+    for i in range(count):
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t + i))
+        audio = 0.1 * envelope * np.sin(2 * np.pi * (150 + 20 * i) * t) + 0.005 * rng.standard_normal(len(t))
+        path = directory / f"clip_{i:03d}.wav"
+        sf.write(path, audio.astype(np.float32), sr)
+        paths.append(path)
+    return paths
+
+
+def make_bursty_clip(seconds=60.0, bursts=12, burst_seconds=2.2, sr=16000, seed=0):
+    """A waveform of `bursts` speech-like bursts separated by near-silence."""
+    spacing = seconds / bursts
+    if burst_seconds > spacing:
+        raise ValueError(f"{bursts} bursts of {burst_seconds} s do not fit in {seconds} s")
+
+    rng = np.random.default_rng(seed)
+    audio = 0.001 * rng.standard_normal(int(seconds * sr))
+    t = np.arange(int(burst_seconds * sr)) / sr
+    for i in range(bursts):
+        start = int((i * spacing + (spacing - burst_seconds) / 2) * sr)
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t + i))
+        audio[start:start + len(t)] += 0.1 * envelope * np.sin(2 * np.pi * (150 + 20 * i) * t)
+    return audio.astype(np.float32)
+
+
+def bench_index(models, work_dir, args):
+    retriever = importlib.import_module("01_clip_retrieval").CLIPRetriever(models["clip"])
+    image_dir = work_dir / "images"
+    make_images(image_dir, args.images)
+
+    latencies = timed(lambda: retriever.index_images(str(image_dir), batch_size=16), args.index_repeats)
+    return {"index": summarize(latencies, items_per_call=args.images)}
+
+
+def bench_search(models, work_dir, args):
+    module = importlib.import_module("01_clip_retrieval")
+    retriever = module.CLIPRetriever(models["clip"])
+    dim = retriever.model.config.projection_dim
+    rng = np.random.default_rng(0)
+    # A fresh query each run (across all sizes), so every search encodes its text
+    counter = iter(range(10 ** 9))
+
+    results = {}
+    for size in args.gallery_sizes:
+        gallery = rng.standard_normal((size, dim)).astype(np.float32)
+        gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+        retriever.image_paths = [f"synthetic_{i}.jpg" for i in range(size)]
+        retriever.image_embeddings = gallery
+        retriever.search_index.build(gallery)
+
+        latencies = timed(
+            lambda: retriever.search_batch([f"query number {next(counter)}"], top_k=5),
+            args.repeats
+        )
+        results[f"search[{size}]"] = summarize(latencies)
+    return results
+
+
+def bench_caption(models, work_dir, args):
+    captioner = importlib.import_module("02_image_captioning").ImageCaptioner(models["blip"])
+    paths = make_images(work_dir / "caption_images", 4, seed=1)
+    cycle = iter(range(10 ** 9))
+
+    latencies = timed(lambda: captioner.caption_image(str(paths[next(cycle) % len(paths)])), args.repeats)
+    return {"caption": summarize(latencies)}
+
+
+def bench_transcribe(models, work_dir, args):
+    transcriber = importlib.import_module("03_whisper_transcription").AudioTranscriber(models["whisper"])
+    paths = make_clips(work_dir / "clips", 4, seconds=args.clip_seconds)
+    cycle = iter(range(10 ** 9))
+
+    latencies = timed(lambda: transcriber.transcribe_audio(str(paths[next(cycle) % len(paths)])), args.repeats)
+    return {"transcribe": summarize(latencies)}
+
+
+def bench_speech(models, work_dir, args):
+    transcriber = importlib.import_module("03_whisper_transcription").AudioTranscriber(models["whisper"])
+    # One burst per 5 s, so the speech fraction does not depend on the length
+    audio = make_bursty_clip(seconds=args.speech_seconds, bursts=max(1, round(args.speech_seconds / 5)))
+    seconds = len(audio) / 16000
+
+    return {
+        "speech[full]": summarize(timed(lambda: transcriber.transcribe_waveform(audio), args.repeats),
+                                  items_per_call=seconds),
+        "speech[vad]": summarize(timed(lambda: transcriber.transcribe_speech(audio), args.repeats),
+                                 items_per_call=seconds),
+    }
+
+
+RUNNERS = {
+    "index": bench_index,
+    "search": bench_search,
+    "caption": bench_caption,
+    "transcribe": bench_transcribe,
+    "speech": bench_speech,
+}
+
+
+def run_benchmark(name, models, work_dir, args):
+    return RUNNERS[name](models, work_dir, args)
+
+
+def run_isolated(name, models, work_dir, args):
+    """Run one benchmark in a fresh spawned process, so its peak RSS is its own."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_benchmark, name, models, work_dir, args).result()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare p50 latency and throughput against a baseline.
+
+    Returns:
+        list: Names of benchmarks that regressed by more than `tolerance`
+    """
+    regressions = []
+    print(f"\n{'benchmark':20s} | {'p50 ms':>9s} {'baseline':>9s} {'change':>8s} | "
+          f"{'items/s':>9s} {'baseline':>9s} {'change':>8s}")
+    print("-" * 86)
+
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:20s} | {current['p50_ms']:9.2f} {'-':>9s} {'new':>8s} |")
+            continue
+
+        latency_change = current["p50_ms"] / base["p50_ms"] - 1
+        throughput_change = current["throughput_per_s"] / base["throughput_per_s"] - 1
+        regressed = latency_change > tolerance or throughput_change < -tolerance / (1 + tolerance)
+        if regressed:
+            regressions.append(name)
+
+        print(f"{name:20s} | {current['p50_ms']:9.2f} {base['p50_ms']:9.2f} {latency_change:+8.1%} | "
+              f"{current['throughput_per_s']:9.1f} {base['throughput_per_s']:9.1f} {throughput_change:+8.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite for the W17D4 demo pipelines")
+    parser.add_argument("--models", choices=["tiny", "pretrained"], default="tiny",
+                        help="tiny: random offline checkpoints (default); pretrained: real ones")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--repeats", type=int, default=30, help="Timed runs per micro-benchmark")
+    parser.add_argument("--index-repeats", type=int, default=5, help="Timed index_images runs")
+    parser.add_argument("--images", type=int, default=64, help="Images in the indexing benchmark")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--clip-seconds", type=float, default=5.0)
+    parser.add_argument("--speech-seconds", type=float, default=60.0, help="Length of the bursty VAD clip")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed slowdown before a result counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run every benchmark in this process (peak RSS then accumulates across benchmarks)")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        if args.models == "tiny":
+            with contextlib.redirect_stdout(io.StringIO()):
+                models = build_tiny_models(work_dir / "models")
+        else:
+            models = PRETRAINED
+
+        for name in args.only:
+            print(f"Running {name}...")
+            run = run_benchmark if args.in_process else run_isolated
+            results.update(run(name, models, work_dir, args))
+
+    print(f"\n{'benchmark':20s} | {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} | {'items/s':>9s} | {'peak RSS MB':>11s}")
+    print("-" * 80)
+    for name, r in results.items():
+        rss = f"{r['peak_rss_mb']:11.0f}" if r["peak_rss_mb"] is not None else f"{'-':>11s}"
+        print(f"{name:20s} | {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} | "
+              f"{r['throughput_per_s']:9.1f} | {rss}")
+
+    report = {
+        "meta": {
+            "models": args.models,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "threads": torch.get_num_threads(),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline["meta"].get("models") != args.models:
+            print(f"\nNote: baseline used {baseline['meta'].get('models')} models, this run used {args.models}")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Top-k selection benchmark
+
+Compares the full sort CLIPRetriever.search used to do
+(np.argsort(scores)[::-1][:k]) with partial selection
+(utils.top_k_indices: argpartition + sort of the k winners) on synthetic
+similarity scores for galleries of 10k, 100k and 1M images.
+
+Usage:
+    python benchmarks/bench_topk.py
+    python benchmarks/bench_topk.py --sizes 10000 100000 --top-k 5 --repeats 50
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "demos"))
+from utils import top_k_indices  # noqa: E402
+
+
+def full_sort(scores, k):
+    return np.argsort(scores)[::-1][:k]
+
+
+def time_ms(fn, scores, k, repeats):
+    """Run fn(scores, k) `repeats` times and return latencies in ms."""
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(scores, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Top-k selection benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    print(f"top_k={args.top_k}, {args.repeats} repeats per size (latency in ms)\n")
+    print(f"{'rows':>10} | {'argsort p50':>11} {'p99':>8} | {'argpartition p50':>16} {'p99':>8} | {'speedup':>7}")
+    print("-" * 75)
+
+    for n in args.sizes:
+        scores = rng.standard_normal(n).astype(np.float32)
+
+        # Both methods must agree before timing means anything
+        assert np.array_equal(np.sort(full_sort(scores, args.top_k)),
+                              np.sort(top_k_indices(scores, args.top_k)))
+
+        sort_ms = time_ms(full_sort, scores, args.top_k, args.repeats)
+        part_ms = time_ms(top_k_indices, scores, args.top_k, args.repeats)
+
+        print(f"{n:>10,} | {np.percentile(sort_ms, 50):>11.3f} {np.percentile(sort_ms, 99):>8.3f} | "
+              f"{np.percentile(part_ms, 50):>16.3f} {np.percentile(part_ms, 99):>8.3f} | "
+              f"{np.median(sort_ms) / np.median(part_ms):>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
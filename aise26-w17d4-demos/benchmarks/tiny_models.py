@@ -0,0 +1,150 @@
+"""
+Tiny randomly initialized CLIP / BLIP / Whisper checkpoints
+
+Builds small models with the real architectures and processors, entirely
+offline (tokenizer vocabularies are generated here), and saves them with
+save_pretrained so the demo wrappers load them through the same
+from_pretrained code paths as the real checkpoints. Outputs are
+meaningless; timings exercise every stage of each pipeline.
+"""
+
+import json
+import string
+from pathlib import Path
+
+import torch
+from transformers import (
+    BertTokenizer,
+    BlipConfig,
+    BlipForConditionalGeneration,
+    BlipImageProcessor,
+    BlipProcessor,
+    CLIPConfig,
+    CLIPImageProcessor,
+    CLIPModel,
+    CLIPProcessor,
+    CLIPTokenizer,
+    WhisperConfig,
+    WhisperFeatureExtractor,
+    WhisperForConditionalGeneration,
+    WhisperProcessor,
+    WhisperTokenizer,
+)
+
+SMALL = dict(hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=2)
+SMALL_VISION = dict(SMALL, image_size=32, patch_size=8)
+
+
+def build_clip(out_dir):
+    out_dir = Path(out_dir)
+    vocab = {"<|startoftext|>": 0, "<|endoftext|>": 1}
+    for c in string.ascii_lowercase + string.digits + ".,!?'-":
+        vocab[c] = len(vocab)
+        vocab[c + "</w>"] = len(vocab)
+
+    tok_dir = out_dir / "tokenizer"
+    tok_dir.mkdir(parents=True, exist_ok=True)
+    (tok_dir / "vocab.json").write_text(json.dumps(vocab))
+    (tok_dir / "merges.txt").write_text("#version: 0.2\n")
+    tokenizer = CLIPTokenizer(str(tok_dir / "vocab.json"), str(tok_dir / "merges.txt"))
+
+    config = CLIPConfig(
+        text_config=dict(SMALL, vocab_size=len(vocab), max_position_embeddings=77,
+                         bos_token_id=0, eos_token_id=1, pad_token_id=1),
+        vision_config=SMALL_VISION,
+        projection_dim=16
+    )
+    image_processor = CLIPImageProcessor(size={"shortest_edge": 32}, crop_size={"height": 32, "width": 32})
+
+    CLIPProcessor(image_processor=image_processor, tokenizer=tokenizer).save_pretrained(out_dir)
+    CLIPModel(config).save_pretrained(out_dir)
+    return str(out_dir)
+
+
+def build_blip(out_dir):
+    out_dir = Path(out_dir)
+    words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "[DEC]"] + list(string.ascii_lowercase)
+    words += ["a", "dog", "cat", "the", "in", "park", "of"]
+    words = list(dict.fromkeys(words))
+
+    tok_dir = out_dir / "tokenizer"
+    tok_dir.mkdir(parents=True, exist_ok=True)
+    (tok_dir / "vocab.txt").write_text("\n".join(words))
+    tokenizer = BertTokenizer(str(tok_dir / "vocab.txt"), bos_token="[DEC]")
+
+    config = BlipConfig(
+        text_config=dict(SMALL, vocab_size=len(words), encoder_hidden_size=32,
+                         bos_token_id=words.index("[DEC]"), sep_token_id=words.index("[SEP]"), pad_token_id=0),
+        vision_config=SMALL_VISION,
+        projection_dim=16
+    )
+    image_processor = BlipImageProcessor(size={"height": 32, "width": 32})
+
+    BlipProcessor(image_processor=image_processor, tokenizer=tokenizer).save_pretrained(out_dir)
+    BlipForConditionalGeneration(config).save_pretrained(out_dir)
+    return str(out_dir)
+
+
+def build_whisper(out_dir):
+    out_dir = Path(out_dir)
+    vocab = {}
+    for c in string.ascii_lowercase + " .,'":
+        vocab["Ġ" if c == " " else c] = len(vocab)
+
+    tok_dir = out_dir / "tokenizer"
+    tok_dir.mkdir(parents=True, exist_ok=True)
+    (tok_dir / "vocab.json").write_text(json.dumps(vocab))
+    (tok_dir / "merges.txt").write_text("#version: 0.2\n")
+
+    eot = "<|endoftext|>"
+    tokenizer = WhisperTokenizer(str(tok_dir / "vocab.json"), str(tok_dir / "merges.txt"),
+                                 unk_token=eot, bos_token=eot, eos_token=eot, pad_token=eot)
+    specials = ["<|startoftranscript|>", "<|en|>", "<|translate|>", "<|transcribe|>",
+                "<|startoflm|>", "<|startofprev|>", "<|nocaptions|>", "<|notimestamps|>"]
+    tokenizer.add_special_tokens({"additional_special_tokens": specials})
+    # Timestamp tokens <|0.00|> ... <|30.00|> follow <|notimestamps|>, as in Whisper
+    tokenizer.add_tokens([f"<|{i * 0.02:.2f}|>" for i in range(1501)])
+    ids = {token: tokenizer.convert_tokens_to_ids(token) for token in [eot] + specials}
+
+    config = WhisperConfig(
+        vocab_size=len(tokenizer), d_model=32, encoder_layers=1, decoder_layers=1,
+        encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=64, decoder_ffn_dim=64,
+        num_mel_bins=80, max_source_positions=1500, max_target_positions=64,
+        decoder_start_token_id=ids["<|startoftranscript|>"],
+        eos_token_id=ids[eot], pad_token_id=ids[eot], bos_token_id=ids[eot],
+        begin_suppress_tokens=None, suppress_tokens=None
+    )
+    model = WhisperForConditionalGeneration(config)
+
+    generation = model.generation_config
+    generation.decoder_start_token_id = ids["<|startoftranscript|>"]
+    generation.no_timestamps_token_id = ids["<|notimestamps|>"]
+    generation.forced_decoder_ids = None
+    generation.is_multilingual = False
+    generation.lang_to_id = {"<|en|>": ids["<|en|>"]}
+    generation.task_to_id = {"transcribe": ids["<|transcribe|>"], "translate": ids["<|translate|>"]}
+    generation.max_initial_timestamp_index = 50
+    generation.max_length = 24
+    # Otherwise from_pretrained rebuilds the generation config from the model
+    # config and drops the Whisper-specific fields above
+    generation._from_model_config = False
+
+    WhisperProcessor(feature_extractor=WhisperFeatureExtractor(feature_size=80), tokenizer=tokenizer).save_pretrained(out_dir)
+    model.save_pretrained(out_dir)
+    return str(out_dir)
+
+
+def build_tiny_models(out_dir, seed=0):
+    """
+    Build all three tiny checkpoints under out_dir.
+
+    Returns:
+        dict: {"clip": path, "blip": path, "whisper": path}
+    """
+    torch.manual_seed(seed)
+    out_dir = Path(out_dir)
+    return {
+        "clip": build_clip(out_dir / "clip"),
+        "blip": build_blip(out_dir / "blip"),
+        "whisper": build_whisper(out_dir / "whisper"),
+    }
@@ -8,83 +8,314 @@ Demonstrates:
 - Retrieving top-k results
 """
 
+import time
+from functools import partial
 import torch
-from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 import numpy as np
 from pathlib import Path
 
+import model_registry
+import tracing
+from ann_index import ExactIndex
+from embedding_index import EmbeddingIndex
+from image_loader import iter_preprocessed_batches, load_rgb
+from image_quality import quality_features, quality_score
+from process_pool import ProcessPoolRunner
+from query_cache import QueryEmbeddingCache
+
+
+def load_clip(model_name, device, dtype=None):
+    """Load CLIP model and processor (called once per key by the model registry)."""
+    print(f"Loading CLIP model: {model_name}")
+    model = CLIPModel.from_pretrained(model_name, torch_dtype=dtype)
+    processor = CLIPProcessor.from_pretrained(model_name)
+    model.to(device)
+    model.eval()
+    return model, processor
+
 
 class CLIPRetriever:
-    def __init__(self, model_name="openai/clip-vit-base-patch32"):
-        """Initialize CLIP model and processor."""
-        print(f"Loading CLIP model: {model_name}")
-        self.model = CLIPModel.from_pretrained(model_name)
-        self.processor = CLIPProcessor.from_pretrained(model_name)
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model.to(self.device)
+    def __init__(self, model_name="openai/clip-vit-base-patch32", query_cache=None,
+                 search_index=None, device=None, torch_dtype=None):
+        """
+        Initialize CLIP retriever.
+
+        The model is not loaded here: it is fetched from the shared model
+        registry on first use, so retrievers for the same (model, device,
+        dtype) share one copy of the weights.
+
+        Text-query embeddings are cached in `query_cache` (a fresh
+        1024-entry QueryEmbeddingCache by default); pass one cache to
+        several retrievers to share it.
+
+        `search_index` is the backend used by search (see ann_index.py):
+        ExactIndex (default) scores every image, IVFIndex trades recall
+        for latency through its `nprobe` setting.
+        """
+        self.model_name = model_name
+        self.device = device or model_registry.default_device()
+        self.torch_dtype = torch_dtype
+
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.search_index = search_index if search_index is not None else ExactIndex()
 
         self.image_paths = []
         self.image_embeddings = None
+        self.index_stats = None
+
+    def _components(self):
+        return model_registry.get_model("clip", self.model_name, load_clip, self.device, self.torch_dtype)
+
+    @property
+    def model(self):
+        return self._components()[0]
+
+    @property
+    def processor(self):
+        return self._components()[1]
+
+    def unload(self):
+        """Release the shared model (it is reloaded on next use)."""
+        return model_registry.unload_model("clip", self.model_name, self.device, self.torch_dtype)
+
+    def index_images(self, image_dir, batch_size=16, num_workers=4, queue_depth=4,
+                     index_path=None, dtype="float32", processes=0):
+        """
+        Encode all images in directory and store embeddings.
+
+        Images are preprocessed and stacked into batches of `batch_size`,
+        so each batch needs a single forward pass and a single copy back
+        to the CPU. `batch_size=1` encodes one image at a time.
+
+        Decoding and preprocessing run on `num_workers` background threads
+        and overlap with the forward pass; at most `queue_depth` prepared
+        batches wait in memory. `num_workers=0` decodes inline.
 
-    def index_images(self, image_dir):
-        """Encode all images in directory and store embeddings."""
+        If `index_path` is given, embeddings are persisted there as
+        `dtype` rows (float32 or float16) and only new or changed files are
+        encoded on later runs. The stored embeddings are then memory-mapped
+        rather than held in RAM.
+
+        With `processes` > 0, images are encoded by that many worker
+        processes (see process_pool.py), each with its own warm copy of
+        the model, in chunks of `batch_size`.
+        """
         image_dir = Path(image_dir)
-        self.image_paths = list(image_dir.glob("*.jpg")) + list(image_dir.glob("*.png"))
+        image_paths = list(image_dir.glob("*.jpg")) + list(image_dir.glob("*.png"))
+
+        print(f"\nIndexing {len(image_paths)} images "
+              f"(batch size {batch_size}, {num_workers} decode workers)...")
+        start = time.perf_counter()
+
+        runner = None
+
+        def encode(paths):
+            nonlocal runner
+            if not processes:
+                return self._encode_paths(paths, batch_size, num_workers, queue_depth)
+
+            # Workers are only started when there is something to encode
+            if runner is None:
+                factory = partial(CLIPRetriever, self.model_name, device=self.device, torch_dtype=self.torch_dtype)
+                runner = ProcessPoolRunner(factory, num_workers=processes)
+            return np.stack(runner.map(_encode_chunk, paths, chunksize=batch_size))
+
+        try:
+            if index_path is None:
+                self.image_paths = image_paths
+                self.image_embeddings = encode(image_paths)
+                num_encoded = len(image_paths)
+            else:
+                index = EmbeddingIndex(index_path, self.model_name, dtype=dtype)
+                changes = index.update(image_paths, encode)
+                index.save()
+
+                self.image_paths = index.paths
+                self.image_embeddings = index.embeddings
+                num_encoded = changes["encoded"]
+                print(f"Index {index_path}: {changes['encoded']} encoded, "
+                      f"{changes['reused']} reused, {changes['removed']} removed")
+        finally:
+            if runner is not None:
+                runner.close()
+
+        with tracing.span("index_images", "postprocess"):
+            self.search_index.build(self.image_embeddings)
+        elapsed = time.perf_counter() - start
+        tracing.record("index_images", "total", elapsed)
+
+        images_per_sec = num_encoded / elapsed if elapsed > 0 else float("inf")
+        self.index_stats = {
+            "num_images": len(self.image_paths),
+            "num_encoded": num_encoded,
+            "batch_size": batch_size,
+            "num_workers": num_workers,
+            "processes": processes,
+            "seconds": elapsed,
+            "images_per_sec": images_per_sec,
+        }
+        print(f"\n[OK] Indexing complete. {len(self.image_paths)} images ready for search.")
+        print(f"     {elapsed:.2f}s total, {images_per_sec:.1f} images/sec\n")
+
+    def load_index(self, index_path):
+        """
+        Open a saved index for searching without touching the image files.
+
+        Embeddings are memory-mapped read-only, so worker processes that
+        load the same index share a single page-cached copy.
+        """
+        index = EmbeddingIndex(index_path, self.model_name)
+        if index.embeddings is None:
+            raise ValueError(f"No usable index at {index_path}. Call index_images() first.")
+
+        self.image_paths = index.paths
+        self.image_embeddings = index.embeddings
+        self.search_index.build(self.image_embeddings)
+        print(f"[OK] Loaded {len(self.image_paths)} embeddings "
+              f"({self.image_embeddings.dtype}) from {index_path}")
+
+    def gallery_quality(self):
+        """
+        Compute quality features for every indexed image.
+
+        Uses image_quality on small draft-mode decodes, so it costs a few
+        ms per image rather than a full decode.
 
-        print(f"\nIndexing {len(self.image_paths)} images...")
+        Returns:
+            np.ndarray: (N x len(image_quality.FEATURES)) matrix aligned with image_paths
+        """
+        if not self.image_paths:
+            raise ValueError("No images indexed. Call index_images() first.")
+        return quality_features(self.image_paths)
+
+    def _encode_paths(self, image_paths, batch_size=16, num_workers=4, queue_depth=4):
+        """Encode image files in batches, returning normalized embeddings (N x D)."""
         embeddings = []
 
-        for img_path in self.image_paths:
-            # Load and preprocess image
-            image = Image.open(img_path)
-            inputs = self.processor(images=image, return_tensors="pt").to(self.device)
+        batches = iter_preprocessed_batches(
+            image_paths,
+            self._preprocess_image,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            queue_depth=queue_depth
+        )
+        for batch_paths, pixel_values in batches:
+            # Encode the whole batch in one forward pass
+            embeddings.append(self._encode_pixels(pixel_values))
+
+            for img_path in batch_paths:
+                print(f"Indexed: {Path(img_path).name}")
+
+        return np.vstack(embeddings)
 
-            # Get image embedding
-            with torch.no_grad():
-                image_features = self.model.get_image_features(**inputs)
-                # Normalize embedding
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+    def _preprocess_image(self, image_path):
+        """Decode and preprocess one image into pixel values (C x H x W)."""
+        with tracing.span("index_images", "decode"):
+            image = load_rgb(image_path)
+        with tracing.span("index_images", "preprocess"):
+            return self.processor(images=image, return_tensors="np")["pixel_values"][0]
 
-            embeddings.append(image_features.cpu().numpy())
-            print(f"Indexed: {img_path.name}")
+    def _encode_pixels(self, pixel_values):
+        """Encode a stacked batch of pixel values into normalized embeddings (N x D)."""
+        model = self.model
+        with tracing.span("index_images", "copy"):
+            pixel_values = torch.from_numpy(pixel_values).to(self.device, dtype=model.dtype)
 
-        self.image_embeddings = np.vstack(embeddings)
-        print(f"\n[OK] Indexing complete. {len(self.image_paths)} images ready for search.\n")
+        with torch.no_grad(), tracing.span("index_images", "forward"):
+            image_features = model.get_image_features(pixel_values=pixel_values)
+            # Normalize embeddings
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+
+        with tracing.span("index_images", "copy"):
+            return image_features.float().cpu().numpy()
 
     def search(self, query_text, top_k=5):
         """Search for images matching the text query."""
+        results = self.search_batch([query_text], top_k=top_k)[0]
+
+        print(f'Query: "{query_text}"')
+        print(f"Top {top_k} Results:")
+        for rank, (img_path, score) in enumerate(results, 1):
+            print(f"{rank}. {Path(img_path).name:20s} - Score: {score:.3f}")
+
+        return results
+
+    def search_batch(self, queries, top_k=5):
+        """
+        Search for several text queries at once.
+
+        All queries are encoded in one forward pass and scored together by
+        the search backend (for ExactIndex, a single (Q x D) @ (D x N)
+        matrix product).
+
+        Returns:
+            list: One list of (image_path, score) tuples per query, in order
+        """
         if self.image_embeddings is None:
             raise ValueError("No images indexed. Call index_images() first.")
+        if not queries:
+            return []
+
+        with tracing.span("search", "total"):
+            text_emb = self._encode_texts(queries)
 
-        # Encode query text
-        inputs = self.processor(text=[query_text], return_tensors="pt", padding=True).to(self.device)
+            # Top-k per query from the search backend
+            with tracing.span("search", "score"):
+                scores, indices = self.search_index.search(text_emb, top_k)
 
-        with torch.no_grad():
-            text_features = self.model.get_text_features(**inputs)
-            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            with tracing.span("search", "postprocess"):
+                results = []
+                for row_scores, row_indices in zip(scores, indices):
+                    results.append([
+                        (str(self.image_paths[idx]), float(score))
+                        for score, idx in zip(row_scores, row_indices)
+                        if idx >= 0
+                    ])
 
-        text_emb = text_features.cpu().numpy()
+        return results
 
-        # Compute similarity scores (dot product)
-        similarities = (text_emb @ self.image_embeddings.T).squeeze()
+    def _encode_texts(self, texts):
+        """
+        Encode a list of strings into normalized embeddings (Q x D).
 
-        # Get top-k results
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        Cached queries are served from `query_cache`; the rest are encoded
+        together in one forward pass and added to the cache.
+        """
+        embeddings = [self.query_cache.get(self.model_name, text) for text in texts]
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
 
-        results = []
-        print(f'Query: "{query_text}"')
-        print(f"Top {top_k} Results:")
-        for rank, idx in enumerate(top_indices, 1):
-            img_path = self.image_paths[idx]
-            score = similarities[idx]
-            results.append((str(img_path), float(score)))
-            print(f"{rank}. {img_path.name:20s} - Score: {score:.3f}")
+        if missing:
+            model = self.model
+            with tracing.span("search", "preprocess"):
+                inputs = self.processor(
+                    text=[texts[i] for i in missing],
+                    return_tensors="pt",
+                    padding=True
+                )
+            with tracing.span("search", "copy"):
+                inputs = inputs.to(self.device)
 
-        return results
+            with torch.no_grad(), tracing.span("search", "forward"):
+                text_features = model.get_text_features(**inputs)
+                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+
+            with tracing.span("search", "copy"):
+                text_features = text_features.float().cpu().numpy()
+
+            for i, emb in zip(missing, text_features):
+                self.query_cache.put(self.model_name, texts[i], emb)
+                embeddings[i] = emb
+
+        return np.stack(embeddings)
 
 
-def demo_clip_retrieval():
+def _encode_chunk(retriever, image_paths):
+    """Process-pool task: encode one chunk of images in a worker."""
+    return retriever._encode_paths(image_paths, batch_size=len(image_paths), num_workers=0)
+
+
+def demo_clip_retrieval(batch_size=16, num_workers=4, use_index=True, index_dtype="float32", processes=0):
     """Run interactive CLIP retrieval demo."""
     print("=" * 60)
     print("CLIP Text-to-Image Retrieval Demo")
@@ -96,7 +327,22 @@ def demo_clip_retrieval():
     # Index images - use path relative to script location
     script_dir = Path(__file__).parent
     image_path = script_dir.parent / "data" / "images"
-    retriever.index_images(str(image_path))
+    # Persisted index: warm runs only encode new or changed images
+    index_path = script_dir.parent / "outputs" / "clip_index" if use_index else None
+    retriever.index_images(
+        str(image_path),
+        batch_size=batch_size,
+        num_workers=num_workers,
+        index_path=index_path,
+        dtype=index_dtype,
+        processes=processes
+    )
+
+    # Flag gallery images that are too dark, flat or blurry to trust matches on
+    scores = quality_score(retriever.gallery_quality())
+    for path, score in zip(retriever.image_paths, scores):
+        if score < 0.5:
+            print(f"[WARNING] Low-quality gallery image: {Path(path).name} (quality {score:.2f})")
 
     # Example queries
     queries = [
@@ -116,10 +362,55 @@ def demo_clip_retrieval():
             print(f"\n[WARNING] Low Confidence: Top score is {top_score:.3f}")
             print("           Consider triggering fallback UX")
 
+    cache = retriever.query_cache.stats()
+    print(f"\nQuery cache: {cache['hits']} hits, {cache['misses']} misses")
+
     print("\n" + "=" * 60)
     print("Demo complete!")
     print("=" * 60)
 
 
 if __name__ == "__main__":
-    demo_clip_retrieval()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CLIP Retrieval Demo")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=16,
+        help="Number of images encoded per forward pass while indexing"
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=4,
+        help="Background threads decoding images while the model runs (0 = inline)"
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Re-encode every image instead of using the index in outputs/"
+    )
+    parser.add_argument(
+        "--index-dtype",
+        choices=["float32", "float16"],
+        default="float32",
+        help="Row type for stored embeddings (float16 halves the index size; "
+             "exact search then upcasts rows per block, about 1.3x slower per query)"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="Worker processes for encoding, each with its own model (0 = in-process)"
+    )
+
+    args = parser.parse_args()
+
+    demo_clip_retrieval(
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        use_index=not args.no_index,
+        index_dtype=args.index_dtype,
+        processes=args.processes
+    )
@@ -9,62 +9,237 @@ Demonstrates:
 
 import sys
 import io
+from functools import partial
 import torch
 import numpy as np
 from PIL import Image
 from transformers import BlipProcessor, BlipForConditionalGeneration
 from pathlib import Path
 
+import model_registry
+import tracing
+from image_loader import iter_preprocessed_batches, load_rgb
+from image_quality import quality_report, quality_score
+from process_pool import PooledWrapper
+from quality_gate import QualityGate
+from utils import image_stats
+
 # Configure UTF-8 output for Windows emoji support
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 
-class ImageCaptioner:
-    def __init__(self, model_name="Salesforce/blip-image-captioning-base"):
-        """Initialize BLIP model and processor."""
-        print(f"Loading BLIP model: {model_name}")
-        self.processor = BlipProcessor.from_pretrained(model_name)
-        self.model = BlipForConditionalGeneration.from_pretrained(model_name)
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model.to(self.device)
+def load_blip(model_name, device, dtype=None):
+    """Load BLIP processor and model (called once per key by the model registry)."""
+    print(f"Loading BLIP model: {model_name}")
+    processor = BlipProcessor.from_pretrained(model_name)
+    model = BlipForConditionalGeneration.from_pretrained(model_name, torch_dtype=dtype)
+    model.to(device)
+    model.eval()
+    return model, processor
+
+
+class ImageCaptioner(PooledWrapper):
+    def __init__(self, model_name="Salesforce/blip-image-captioning-base", device=None, torch_dtype=None,
+                 quality_gate=None):
+        """
+        Initialize BLIP captioner.
+
+        The model is loaded lazily from the shared model registry on first
+        use, and captioners with the same (model, device, dtype) share it.
+        With a QualityGate, caption_with_stats/caption_with_confidence
+        return the gate's fallback caption for rejected images without
+        running the model.
+        """
+        self.model_name = model_name
+        self.device = device or model_registry.default_device()
+        self.torch_dtype = torch_dtype
+        self.quality_gate = quality_gate
+
+    def _components(self):
+        return model_registry.get_model("blip", self.model_name, load_blip, self.device, self.torch_dtype)
+
+    @property
+    def model(self):
+        return self._components()[0]
+
+    @property
+    def processor(self):
+        return self._components()[1]
+
+    def unload(self):
+        """Release the shared model (it is reloaded on next use)."""
+        return model_registry.unload_model("blip", self.model_name, self.device, self.torch_dtype)
+
+    def worker_factory(self):
+        return partial(ImageCaptioner, self.model_name, device=self.device, torch_dtype=self.torch_dtype)
 
     def caption_image(self, image_path, max_length=50):
         """Generate caption for an image."""
-        # Load image
-        image = Image.open(image_path).convert('RGB')
+        with tracing.span("caption_image", "total"):
+            # Load image
+            with tracing.span("caption_image", "decode"):
+                image = Image.open(image_path).convert('RGB')
+
+            # Preprocess
+            model = self.model
+            with tracing.span("caption_image", "preprocess"):
+                inputs = self.processor(images=image, return_tensors="pt")
+            with tracing.span("caption_image", "copy"):
+                inputs = inputs.to(self.device, model.dtype)
+
+            # Generate caption
+            return self._generate(inputs["pixel_values"], max_length)[0]
+
+    def caption_batch(self, image_paths, max_length=50, batch_size=8, num_workers=4, processes=0):
+        """
+        Generate captions for many images, one generate() call per batch.
+
+        BLIP's processor resizes every image to the same resolution, so
+        pixel tensors stack directly into a batch. Images are decoded on
+        `num_workers` background threads while the previous batch is being
+        captioned.
+
+        With `processes` > 0, chunks of `batch_size` images are captioned by
+        that many worker processes instead (see process_pool.py), each with
+        its own warm copy of the model. The pool is started by the first
+        such call and reused by later ones; close() stops it.
+
+        Returns:
+            list: Captions in the same order as `image_paths`
+        """
+        if processes:
+            return self.process_pool(processes).map(partial(_caption_chunk, max_length=max_length), image_paths,
+                                                    chunksize=batch_size)
+
+        captions = []
+
+        batches = iter_preprocessed_batches(
+            list(image_paths),
+            self._preprocess_image,
+            batch_size=batch_size,
+            num_workers=num_workers
+        )
+        for _, pixel_values in batches:
+            with tracing.span("caption_image", "copy"):
+                pixel_values = torch.from_numpy(pixel_values).to(self.device, self.model.dtype)
+            captions.extend(self._generate(pixel_values, max_length))
 
-        # Preprocess
-        inputs = self.processor(images=image, return_tensors="pt").to(self.device)
+        return captions
 
-        # Generate caption
-        with torch.no_grad():
-            outputs = self.model.generate(**inputs, max_length=max_length)
+    def _preprocess_image(self, image_path):
+        """Decode and preprocess one image into pixel values (C x H x W)."""
+        with tracing.span("caption_image", "decode"):
+            image = load_rgb(image_path)
+        with tracing.span("caption_image", "preprocess"):
+            return self.processor(images=image, return_tensors="np")["pixel_values"][0]
 
-        caption = self.processor.decode(outputs[0], skip_special_tokens=True)
+    def _generate(self, pixel_values, max_length, with_confidence=False):
+        """
+        Run generate() on a batch of pixel values and decode every caption.
 
-        return caption
+        With `with_confidence`, the same generate() call also returns the
+        per-step scores, and each caption gets a token confidence: the
+        geometric mean probability of its generated tokens (exp of the mean
+        log-probability, EOS included, padding after EOS excluded).
 
-    def caption_with_confidence(self, image_path):
-        """Generate caption and estimate confidence based on image quality."""
-        caption = self.caption_image(image_path)
+        Returns:
+            list: Captions, or (captions, token confidences) with `with_confidence`
+        """
+        with torch.no_grad(), tracing.span("caption_image", "forward"):
+            outputs = self.model.generate(
+                pixel_values=pixel_values,
+                max_length=max_length,
+                output_scores=with_confidence,
+                return_dict_in_generate=with_confidence
+            )
 
-        # Simple heuristic: check image brightness as proxy for quality
-        image = Image.open(image_path).convert('L')  # Convert to grayscale
-        brightness = np.array(image).mean()
+        if not with_confidence:
+            with tracing.span("caption_image", "postprocess"):
+                return self.processor.batch_decode(outputs, skip_special_tokens=True)
 
-        confidence = "High" if brightness > 50 else "Low"
+        with tracing.span("caption_image", "postprocess"):
+            return self._decode_with_confidence(outputs)
+
+    def _decode_with_confidence(self, outputs):
+        """Decode generate() outputs into (captions, token confidences)."""
+        captions = self.processor.batch_decode(outputs.sequences, skip_special_tokens=True)
+
+        # Log-probability of each chosen token, one column per generation step
+        logprobs = self.model.compute_transition_scores(outputs.sequences, outputs.scores, normalize_logits=True)
+        tokens = outputs.sequences[:, -logprobs.shape[1]:]
+
+        # BLIP's generate() stops on the text decoder's [SEP] token
+        is_eos = tokens == self.model.config.text_config.sep_token_id
+        after_eos = (is_eos.cumsum(dim=1) - is_eos.int()) > 0
+        mask = (~after_eos).float()
+
+        mean_logprob = (logprobs.float() * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return captions, mean_logprob.exp().tolist()
+
+    def caption_with_stats(self, image_path, max_length=50):
+        """
+        Generate a caption and image quality statistics from a single decode.
+
+        The decoded RGB array is fed to the processor, utils.image_stats and
+        image_quality, so the file is read and decompressed only once.
+
+        The 0-1 "token_confidence" comes from the scores of the same
+        generate() call (see _generate), so it costs no extra forward pass.
+
+        Returns:
+            tuple: (caption, stats dict from utils.image_stats, with the
+                image_quality features under "quality", their 0-1
+                "quality_score", "token_confidence", and the gate's
+                "rejected" reasons)
+        """
+        pixels = np.asarray(load_rgb(image_path))
+        stats = image_stats(pixels)
+        stats["quality"] = quality_report(pixels)
+        stats["quality_score"] = quality_score(stats["quality"])
+
+        # Early exit: skip generate() for inputs the gate would reject anyway
+        stats["rejected"] = self.quality_gate.check_image(stats) if self.quality_gate else []
+        if stats["rejected"]:
+            stats["token_confidence"] = 0.0
+            return self.quality_gate.image_fallback, stats
+
+        inputs = self.processor(images=pixels, return_tensors="pt").to(self.device, self.model.dtype)
+        captions, confidences = self._generate(inputs["pixel_values"], max_length, with_confidence=True)
+        stats["token_confidence"] = confidences[0]
+
+        return captions[0], stats
+
+    def caption_with_confidence(self, image_path, min_token_confidence=0.3):
+        """
+        Generate caption and estimate confidence.
+
+        "High" needs both a confident decoder (token confidence of at least
+        `min_token_confidence`) and a reasonably lit image, since BLIP can
+        be fluent and confident about a dark image it is hallucinating on.
+        """
+        caption, stats = self.caption_with_stats(image_path)
+
+        confident = stats["token_confidence"] >= min_token_confidence
+        # Grayscale brightness as a proxy for image quality
+        well_lit = stats["luminance"] > 50
+        confidence = "High" if confident and well_lit and not stats["rejected"] else "Low"
 
         return caption, confidence
 
 
+def _caption_chunk(captioner, image_paths, max_length):
+    """Process-pool task: caption one chunk of images in a worker."""
+    return captioner.caption_batch(image_paths, max_length=max_length, batch_size=len(image_paths), num_workers=0)
+
+
 def demo_image_captioning():
     """Run interactive image captioning demo."""
     print("=" * 60)
     print("BLIP Image Captioning Demo")
     print("=" * 60)
 
-    captioner = ImageCaptioner()
+    captioner = ImageCaptioner(quality_gate=QualityGate())
 
     # Build correct path relative to script location
     script_dir = Path(__file__).parent
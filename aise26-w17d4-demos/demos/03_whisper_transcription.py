@@ -10,21 +10,89 @@ Demonstrates:
 
 import sys
 import io
-import torch
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import librosa
+import soundfile as sf
 from transformers import pipeline
 from pathlib import Path
 
+import model_registry
+import tracing
+from process_pool import PooledWrapper
+from quality_gate import QualityGate
+from vad import pack_segments, speech_segments
+
+# Whisper models expect 16 kHz mono input
+SAMPLE_RATE = 16000
+# Whisper's input window; longer clips are decoded one at a time in transcribe_batch
+MAX_BATCHED_SAMPLES = 30 * SAMPLE_RATE
+
 # Configure UTF-8 output for Windows emoji support
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 
-class AudioTranscriber:
-    def __init__(self, model_name="openai/whisper-tiny"):
+def load_whisper(model_name, device, dtype=None):
+    """Build the Whisper ASR pipeline (called once per key by the model registry)."""
+    print(f"Loading Whisper model: {model_name}")
+    print("(First run will download the model - this may take a few minutes)")
+
+    asr = pipeline(
+        "automatic-speech-recognition",
+        model=model_name,
+        device=device,
+        torch_dtype=dtype
+    )
+    _trace_stages(asr)
+    return asr
+
+
+def _trace_stages(asr):
+    """
+    Time the pipeline's preprocess / forward / postprocess calls as
+    transcribe_audio stages.
+
+    The pipeline looks these methods up on the instance for single and
+    batched calls alike, so wrapping them there covers both. "forward"
+    includes the pipeline's own host/device copies.
+    """
+    preprocess, forward, postprocess = asr.preprocess, asr.forward, asr.postprocess
+
+    def traced_preprocess(*args, **kwargs):
+        # preprocess is a generator (one item per 30 s chunk): time each step
+        chunks = preprocess(*args, **kwargs)
+        while True:
+            with tracing.span("transcribe_audio", "preprocess"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def traced_forward(*args, **kwargs):
+        with tracing.span("transcribe_audio", "forward"):
+            return forward(*args, **kwargs)
+
+    def traced_postprocess(*args, **kwargs):
+        with tracing.span("transcribe_audio", "postprocess"):
+            return postprocess(*args, **kwargs)
+
+    asr.preprocess = traced_preprocess
+    asr.forward = traced_forward
+    asr.postprocess = traced_postprocess
+
+
+class AudioTranscriber(PooledWrapper):
+    def __init__(self, model_name="openai/whisper-tiny", device=None, torch_dtype=None, quality_gate=None):
         """
-        Initialize Whisper ASR model.
+        Initialize Whisper ASR transcriber.
+
+        The pipeline is loaded lazily from the shared model registry on
+        first use, and transcribers with the same (model, device, dtype)
+        share it. With a QualityGate, transcribe_with_confidence returns
+        the gate's fallback text for rejected audio without running ASR.
 
         Model sizes available:
         - whisper-tiny: Fastest, ~39M parameters
@@ -33,30 +101,285 @@ class AudioTranscriber:
         - whisper-medium: ~769M parameters (requires more memory)
         - whisper-large: ~1550M parameters (GPU recommended)
         """
-        print(f"Loading Whisper model: {model_name}")
-        print("(First run will download the model - this may take a few minutes)")
-
-        self.asr = pipeline(
-            "automatic-speech-recognition",
-            model=model_name,
-            device=0 if torch.cuda.is_available() else -1
-        )
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model_name = model_name
+        self.device = device or model_registry.default_device()
+        self.torch_dtype = torch_dtype
+        self.quality_gate = quality_gate
         print(f"Using device: {self.device}")
 
+    @property
+    def asr(self):
+        return model_registry.get_model("whisper", self.model_name, load_whisper, self.device, self.torch_dtype)
+
+    def unload(self):
+        """Release the shared pipeline (it is reloaded on next use)."""
+        return model_registry.unload_model("whisper", self.model_name, self.device, self.torch_dtype)
+
+    def worker_factory(self):
+        return partial(AudioTranscriber, self.model_name, device=self.device, torch_dtype=self.torch_dtype)
+
+    def load_audio(self, audio_path):
+        """
+        Decode and resample an audio file to 16 kHz mono, once.
+
+        Pass the result to audio_quality and transcribe_waveform instead of
+        letting each of them reload the file.
+        """
+        # librosa avoids the need for ffmpeg
+        with tracing.span("transcribe_audio", "decode"):
+            audio, _ = librosa.load(audio_path, sr=SAMPLE_RATE)
+        return audio
+
     def transcribe_audio(self, audio_path):
         """Transcribe audio file to text."""
         if not Path(audio_path).exists():
             return {"error": f"File not found: {audio_path}"}
 
-        # Load audio with librosa (avoids need for ffmpeg)
-        audio, sr = librosa.load(audio_path, sr=16000)
+        with tracing.span("transcribe_audio", "total"):
+            return self.transcribe_waveform(self.load_audio(audio_path))
 
-        # Transcribe (pass numpy array instead of file path)
+    def transcribe_waveform(self, audio):
+        """Transcribe a 16 kHz mono waveform (as returned by load_audio)."""
         # return_timestamps=True handles audio longer than 30 seconds
-        result = self.asr(audio, return_timestamps=True)
+        return self.asr(audio, return_timestamps=True)
 
-        return result
+    def transcribe_batch(self, audio_paths, batch_size=8, num_workers=4, window=256, processes=0):
+        """
+        Transcribe many files with batched pipeline calls.
+
+        Files are processed in windows of `window`. The files in a window
+        are decoded on `num_workers` threads (the next window decodes while
+        the current one is transcribed), sorted by length so each batch
+        holds clips of similar duration (little padding), and sent to the
+        pipeline `batch_size` at a time. Clips over 30 s are transcribed
+        one at a time. If the pipeline fails on a batch, its clips are
+        retried one at a time, so only the clip at fault gets an error.
+
+        With `processes` > 0, chunks of 4 batches are sent to that many
+        worker processes instead (see process_pool.py); each worker holds
+        its own warm pipeline and batches its chunk the same way. The pool
+        is started by the first such call and reused by later ones;
+        close() stops it.
+
+        Returns:
+            list: One dict per path, in input order: {"path", "text",
+                "duration", "decode_seconds", "asr_seconds"} (asr_seconds is
+                the file's share of its batch), or {"path", "error"}
+        """
+        audio_paths = [str(path) for path in audio_paths]
+
+        if processes:
+            return self.process_pool(processes).map(partial(_transcribe_chunk, batch_size=batch_size), audio_paths,
+                                                    chunksize=batch_size * 4)
+
+        results = [None] * len(audio_paths)
+
+        def decode(i):
+            start = time.perf_counter()
+            if not Path(audio_paths[i]).exists():
+                return i, FileNotFoundError(f"File not found: {audio_paths[i]}"), 0.0
+            try:
+                return i, self.load_audio(audio_paths[i]), time.perf_counter() - start
+            except Exception as e:
+                return i, e, time.perf_counter() - start
+
+        windows = [range(i, min(i + window, len(audio_paths))) for i in range(0, len(audio_paths), window)]
+
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as pool:
+            pending = pool.map(decode, windows[0]) if windows else None
+            for w in range(len(windows)):
+                decoded = list(pending)
+                if w + 1 < len(windows):
+                    pending = pool.map(decode, windows[w + 1])
+
+                ready = []
+                for i, audio, decode_seconds in decoded:
+                    if isinstance(audio, Exception):
+                        results[i] = {"path": audio_paths[i], "error": str(audio)}
+                    else:
+                        ready.append((len(audio), i, audio, decode_seconds))
+                ready.sort(key=lambda item: item[0])
+
+                # Clips over 30 s take the pipeline's long-form path, whose
+                # inputs cannot share a batch with short clips: run them alone
+                short = [item for item in ready if item[0] <= MAX_BATCHED_SAMPLES]
+                batches = [short[b:b + batch_size] for b in range(0, len(short), batch_size)]
+                batches += [[item] for item in ready[len(short):]]
+
+                for batch in batches:
+                    start = time.perf_counter()
+                    try:
+                        outputs = self.asr([audio for _, _, audio, _ in batch], batch_size=batch_size,
+                                           return_timestamps=True)
+                        asr_seconds = [(time.perf_counter() - start) / len(batch)] * len(batch)
+                    except Exception:
+                        # One bad clip fails the whole batch: retry its clips
+                        # one at a time so only that clip gets an error
+                        outputs, asr_seconds = self._transcribe_each([audio for _, _, audio, _ in batch])
+
+                    for (length, i, _, decode_seconds), output, seconds in zip(batch, outputs, asr_seconds):
+                        if isinstance(output, Exception):
+                            results[i] = {"path": audio_paths[i], "error": str(output)}
+                            continue
+                        results[i] = {
+                            "path": audio_paths[i],
+                            "text": output.get("text", ""),
+                            "duration": length / SAMPLE_RATE,
+                            "decode_seconds": decode_seconds,
+                            "asr_seconds": seconds
+                        }
+
+        return results
+
+    def _transcribe_each(self, clips):
+        """
+        Transcribe clips one pipeline call each (the fallback for a failed batch).
+
+        Returns:
+            tuple: (outputs, asr_seconds) lists, an output being the
+                exception its clip raised if it failed
+        """
+        outputs, asr_seconds = [], []
+        for audio in clips:
+            start = time.perf_counter()
+            try:
+                outputs.append(self.asr(audio, return_timestamps=True))
+            except Exception as e:
+                outputs.append(e)
+            asr_seconds.append(time.perf_counter() - start)
+        return outputs, asr_seconds
+
+    def transcribe_speech(self, audio, batch_size=8, gap_s=0.3, **vad_options):
+        """
+        Transcribe only the speech in a 16 kHz waveform.
+
+        vad.speech_segments finds the speech, and vad.pack_segments packs
+        consecutive segments into windows of at most 30 s, separated by
+        `gap_s` of silence. Each window is one Whisper input (Whisper pads
+        every input to 30 s, so a window per segment would cost a full
+        window each), and all windows go to the pipeline in one batched
+        call. Timestamps are mapped from the packed windows back to
+        positions in the original waveform. Silence never reaches the
+        model.
+
+        Args:
+            audio (np.ndarray): 16 kHz mono waveform (see load_audio)
+            batch_size (int): Windows per forward pass
+            gap_s (float): Silence between packed segments, in seconds
+            **vad_options: Passed to vad.speech_segments
+
+        Returns:
+            dict: {"text", "chunks": [{"timestamp", "text"}],
+                "speech_segments": [(start, end)], "speech_ratio"}
+        """
+        segments = speech_segments(audio, sr=SAMPLE_RATE, **vad_options)
+        windows = pack_segments(segments, max_window_s=MAX_BATCHED_SAMPLES / SAMPLE_RATE, gap_s=gap_s)
+
+        # Per window: the packed waveform, and matching knots on the packed
+        # and original timelines (segment starts and ends) for np.interp
+        gap = np.zeros(int(gap_s * SAMPLE_RATE), dtype=audio.dtype)
+        packed, knots = [], []
+        for window in windows:
+            parts, packed_times, original_times = [], [], []
+            position = 0
+            for start, end in window:
+                clip = audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+                if parts:
+                    parts.append(gap)
+                    position += len(gap)
+                packed_times += [position / SAMPLE_RATE, (position + len(clip)) / SAMPLE_RATE]
+                original_times += [start, end]
+                parts.append(clip)
+                position += len(clip)
+            # Sample rounding must not push a window past 30 s (long-form path)
+            packed.append(np.concatenate(parts)[:MAX_BATCHED_SAMPLES])
+            knots.append((packed_times, original_times))
+
+        chunks = []
+        outputs = self.asr(packed, batch_size=batch_size, return_timestamps=True) if packed else []
+        for (packed_times, original_times), output in zip(knots, outputs):
+            for chunk in output.get("chunks", []):
+                chunk_start, chunk_end = chunk["timestamp"]
+                chunk_start = chunk_start or 0.0
+                chunk_end = packed_times[-1] if chunk_end is None else chunk_end
+                # Times inside a segment shift by its offset; times in an
+                # inserted gap land between the two segments' ends
+                timestamp = tuple(float(t) for t in np.interp([chunk_start, chunk_end], packed_times, original_times))
+                chunks.append({"timestamp": timestamp, "text": chunk["text"]})
+
+        speech_seconds = sum(end - start for start, end in segments)
+        return {
+            "text": "".join(chunk["text"] for chunk in chunks),
+            "chunks": chunks,
+            "speech_segments": segments,
+            "speech_ratio": speech_seconds * SAMPLE_RATE / len(audio) if len(audio) else 0.0
+        }
+
+    def transcribe_stream(self, audio_path, chunk_length_s=30.0, overlap_s=5.0):
+        """
+        Transcribe a long file chunk by chunk, yielding text as it is ready.
+
+        The file is read in fixed windows with soundfile (only one chunk is
+        in memory at a time), each window is downmixed and resampled to
+        16 kHz, and Whisper transcribes it as one <= 30 s chunk. Consecutive
+        chunks overlap by `overlap_s` seconds so words on a boundary are
+        heard whole. Each chunk owns the middle of its overlaps, and a
+        segment is kept by the chunk that owns its midpoint, so nothing is
+        emitted twice.
+
+        Yields:
+            dict: {"text", "chunks": [{"timestamp": (start, end), "text"}],
+                "start", "end"}, with timestamps in seconds from the start
+                of the file; or a single {"error": ...}
+        """
+        if not Path(audio_path).exists():
+            yield {"error": f"File not found: {audio_path}"}
+            return
+        if not 0 <= overlap_s < chunk_length_s:
+            raise ValueError(f"overlap_s must be in [0, chunk_length_s), got {overlap_s}")
+
+        with sf.SoundFile(audio_path) as f:
+            native_sr = f.samplerate
+            block_frames = int(chunk_length_s * native_sr)
+            step_frames = block_frames - int(overlap_s * native_sr)
+
+            start_frame = 0
+            while True:
+                f.seek(start_frame)
+                block = f.read(block_frames, dtype="float32", always_2d=True)
+                is_last = start_frame + len(block) >= f.frames
+                if len(block) == 0:
+                    break
+
+                audio = librosa.resample(block.mean(axis=1), orig_sr=native_sr, target_sr=SAMPLE_RATE)
+                offset = start_frame / native_sr
+                duration = len(block) / native_sr
+
+                # Part of this chunk whose segments we keep
+                keep_from = 0.0 if start_frame == 0 else overlap_s / 2
+                keep_to = duration if is_last else duration - overlap_s / 2
+
+                segments = []
+                for segment in self.transcribe_waveform(audio).get("chunks", []):
+                    seg_start, seg_end = segment["timestamp"]
+                    seg_start = seg_start or 0.0
+                    seg_end = duration if seg_end is None else min(seg_end, duration)
+                    if keep_from <= (seg_start + seg_end) / 2 < keep_to:
+                        segments.append({
+                            "timestamp": (offset + seg_start, offset + seg_end),
+                            "text": segment["text"]
+                        })
+
+                yield {
+                    "text": "".join(segment["text"] for segment in segments),
+                    "chunks": segments,
+                    "start": offset + keep_from,
+                    "end": offset + keep_to
+                }
+
+                if is_last:
+                    break
+                start_frame += step_frames
 
     def analyze_audio_quality(self, audio_path):
         """
@@ -65,58 +388,89 @@ class AudioTranscriber:
         Returns signal-to-noise estimate and duration.
         """
         try:
-            # Load audio
-            audio, sr = librosa.load(audio_path, sr=16000)
+            return self.audio_quality(self.load_audio(audio_path))
+        except Exception as e:
+            return {"error": str(e)}
 
-            # Calculate duration
-            duration = len(audio) / sr
+    def audio_quality(self, audio):
+        """
+        Quality metrics for a waveform that is already decoded (16 kHz).
 
-            # Estimate signal quality (simple RMS energy check)
-            rms_energy = np.sqrt(np.mean(audio**2))
+        Duration comes from the sample count, and RMS energy from a single
+        dot product over the buffer, so no squared copy is made.
+        """
+        duration = len(audio) / SAMPLE_RATE
 
-            # Simple heuristic for quality
-            if rms_energy > 0.05:
-                quality = "High"
-            elif rms_energy > 0.02:
-                quality = "Medium"
-            else:
-                quality = "Low"
+        # Estimate signal quality (simple RMS energy check)
+        rms_energy = float(np.sqrt(np.dot(audio, audio) / len(audio))) if len(audio) else 0.0
 
-            return {
-                "duration": duration,
-                "rms_energy": rms_energy,
-                "quality": quality
-            }
-        except Exception as e:
-            return {"error": str(e)}
+        # Simple heuristic for quality
+        if rms_energy > 0.05:
+            quality = "High"
+        elif rms_energy > 0.02:
+            quality = "Medium"
+        else:
+            quality = "Low"
+
+        return {
+            "duration": duration,
+            "rms_energy": rms_energy,
+            "quality": quality
+        }
 
-    def transcribe_with_confidence(self, audio_path):
-        """Transcribe audio and provide quality/confidence assessment."""
+    def transcribe_with_confidence(self, audio_path, use_vad=False):
+        """
+        Transcribe audio and provide quality/confidence assessment.
+
+        The file is decoded and resampled once; the same waveform feeds the
+        quality analysis and the ASR pipeline. Quality is analyzed first so
+        the quality gate (if any) can reject the file before ASR runs;
+        rejected files get the gate's fallback text and their reasons under
+        "rejected". With `use_vad`, only detected speech is transcribed
+        (see transcribe_speech) and "speech_ratio" is added.
+        """
         try:
-            # Get transcription
-            transcription = self.transcribe_audio(audio_path)
+            if not Path(audio_path).exists():
+                return {"error": f"File not found: {audio_path}"}
 
-            # Check for error in transcription
-            if "error" in transcription:
-                return {"error": transcription["error"]}
+            audio = self.load_audio(audio_path)
 
             # Analyze audio quality
-            quality_info = self.analyze_audio_quality(audio_path)
+            quality_info = self.audio_quality(audio)
 
-            # Check for error in quality analysis
-            if "error" in quality_info:
-                return {"error": quality_info["error"]}
-
-            return {
-                "text": transcription.get("text", ""),
-                "quality": quality_info.get("quality", "Unknown"),
-                "duration": quality_info.get("duration", 0),
-                "rms_energy": quality_info.get("rms_energy", 0)
+            result = {
+                "quality": quality_info["quality"],
+                "duration": quality_info["duration"],
+                "rms_energy": quality_info["rms_energy"],
+                "rejected": []
             }
+
+            # Early exit: skip ASR for inputs the gate would reject anyway
+            if self.quality_gate:
+                result["rejected"] = self.quality_gate.check_audio(result["duration"], result["rms_energy"])
+            if result["rejected"]:
+                result["text"] = self.quality_gate.audio_fallback
+                result["quality"] = "Low"
+                return result
+
+            # Get transcription
+            if use_vad:
+                transcription = self.transcribe_speech(audio)
+                result["speech_ratio"] = transcription["speech_ratio"]
+            else:
+                transcription = self.transcribe_waveform(audio)
+
+            result["text"] = transcription.get("text", "")
+            return result
         except Exception as e:
             return {"error": str(e)}
 
 
+def _transcribe_chunk(transcriber, audio_paths, batch_size):
+    """Process-pool task: transcribe one chunk of files in a worker."""
+    return transcriber.transcribe_batch(audio_paths, batch_size=batch_size, num_workers=1)
+
+
 def demo_whisper_transcription():
     """Run interactive Whisper transcription demo."""
     print("=" * 60)
@@ -149,7 +503,7 @@ def demo_whisper_transcription():
         return
 
     # Initialize transcriber
-    transcriber = AudioTranscriber()
+    transcriber = AudioTranscriber(quality_gate=QualityGate())
 
     # Test audio files (use audio_dir to build paths)
     test_files = [
@@ -197,7 +551,9 @@ def demo_whisper_transcription():
         print(f"\nTranscription:\n  \"{result['text']}\"")
 
         # Add warnings for stress cases
-        if result['quality'] == "Low":
+        if result['rejected']:
+            print("\n⚠️  Skipped transcription: " + "; ".join(result['rejected']))
+        elif result['quality'] == "Low":
             print("\n⚠️  Warning: Low audio quality detected")
             print("   Transcription may be unreliable")
         elif result['duration'] < 1.0:
@@ -274,9 +630,22 @@ if __name__ == "__main__":
         help="Show instructions for creating sample audio files"
     )
 
+    parser.add_argument(
+        "--stream",
+        metavar="AUDIO_PATH",
+        help="Transcribe one long file in 30s chunks, printing text as each chunk finishes"
+    )
+
     args = parser.parse_args()
 
     if args.setup_info:
         create_sample_info()
+    elif args.stream:
+        transcriber = AudioTranscriber()
+        for part in transcriber.transcribe_stream(args.stream):
+            if "error" in part:
+                print(f"❌ Error: {part['error']}")
+                break
+            print(f"[{part['start']:7.1f}s - {part['end']:7.1f}s]{part['text']}")
     else:
         demo_whisper_transcription()
@@ -0,0 +1,411 @@
+"""
+Search index backends for CLIP retrieval
+
+Every backend has the same two methods:
+    build(embeddings)         - prepare the index over an (N x D) gallery
+    search(queries, top_k)    - return (scores, indices), each (Q x top_k),
+                                best match first
+
+ExactIndex scores every row (brute-force dot product) and is the default.
+IVFIndex is a pure-NumPy approximate index: a k-means coarse quantizer
+splits the gallery into `nlist` inverted lists, and each query only
+scans the `nprobe` lists whose centroids are closest. Raising nprobe
+trades latency for recall. With `pq_subvectors` set, list vectors are
+stored as product-quantization codes (one byte per subvector) of their
+residual from the list centroid instead of float32 rows, and scores
+become approximate.
+
+QuantizedIndex keeps only a compact float16 or per-row-scaled int8 copy
+of the gallery in RAM for the full scan (2x / 4x less memory than
+float32), then rescores a short list of candidates against the original
+rows read from a memory-mapped file (CLIPRetriever.load_index), so only
+the short list is paged in.
+"""
+
+import warnings
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from utils import top_k_indices
+
+
+def _assign(vectors, centroids, chunk_size=16384):
+    """Index of the nearest centroid (L2) for each vector, computed in chunks."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+
+    for start in range(0, len(vectors), chunk_size):
+        block = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, and ||x||^2 is constant per row
+        distances = centroid_norms - 2 * (block @ centroids.T)
+        assignment[start:start + len(block)] = distances.argmin(axis=1)
+
+    return assignment
+
+
+def kmeans(vectors, k, iterations=20, seed=0):
+    """
+    Plain Lloyd's k-means in NumPy.
+
+    Args:
+        vectors (np.ndarray): Training data (N x D), N >= k
+        k (int): Number of centroids
+        iterations (int): Lloyd iterations
+        seed (int): Seed for initialisation and empty-cluster restarts
+
+    Returns:
+        np.ndarray: Centroids (k x D), float32
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = _assign(vectors, centroids)
+
+        # Sum each cluster with one sort + reduceat instead of a loop over clusters
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=k)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+
+        # Restart empty clusters on random training points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+
+    return centroids
+
+
+def _as_tensor(rows):
+    """Share an array's memory with torch (memory-mapped rows are read-only)."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+        return torch.from_numpy(np.asarray(rows))
+
+
+def _upcast_similarities(queries, rows, chunk_size=2048, native_single_query=False):
+    """
+    Score float32 queries (Q x D) against float16 or int8 rows (N x D).
+
+    Returns a (Q x N) float32 array. NumPy's float16 -> float32 cast is
+    about 14x slower than the scan itself, so rows are upcast with torch,
+    `chunk_size` at a time (small enough to stay in cache). With
+    native_single_query, a single query against float16 rows is scored by
+    one half-precision matrix-vector product instead, which reads half the
+    bytes of a float32 scan but rounds the scores to float16.
+    """
+    queries = torch.from_numpy(np.ascontiguousarray(queries, dtype=np.float32))
+    rows = _as_tensor(rows)
+
+    with torch.no_grad():
+        if native_single_query and len(queries) == 1 and rows.dtype == torch.float16:
+            return torch.mv(rows, queries[0].half()).float().numpy()[None, :]
+
+        similarities = torch.empty((len(queries), len(rows)), dtype=torch.float32)
+        for start in range(0, len(rows), chunk_size):
+            block = rows[start:start + chunk_size].float()
+            similarities[:, start:start + len(block)] = queries @ block.T
+
+    return similarities.numpy()
+
+
+def _pack_int8(codes, scales):
+    """
+    Prepack int8 rows for torch's dynamic quantized linear (FBGEMM/oneDNN).
+
+    Its int8 kernels score a few queries against the codes about 4x faster
+    than a float32 scan. Returns None where the quantized engine does not
+    support per-row scales.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message=".*quantized tensor creation.*")
+            weight = torch._make_per_channel_quantized_tensor(
+                torch.from_numpy(codes), torch.from_numpy(scales.astype(np.float64)),
+                torch.zeros(len(codes), dtype=torch.long), 0)
+            return torch.ops.quantized.linear_prepack(weight, None)
+    except (RuntimeError, AttributeError):
+        return None
+
+
+class ExactIndex:
+    def __init__(self, chunk_size=65536):
+        """Brute-force inner-product search over every row."""
+        self.chunk_size = chunk_size
+        self.embeddings = None
+
+    def build(self, embeddings):
+        """Keep a reference to the gallery (it may be memory-mapped or float16)."""
+        self.embeddings = embeddings
+        return self
+
+    def search(self, queries, top_k):
+        """Score every row and return the top_k (scores, indices) per query."""
+        similarities = self.similarities(queries)
+        indices = top_k_indices(similarities, top_k)
+        return np.take_along_axis(similarities, indices, axis=1), indices
+
+    def similarities(self, queries):
+        """
+        Score queries (Q x D) against every row (Q x N).
+
+        The gallery is read in row chunks, so a memory-mapped or float16
+        gallery is never copied to float32 in full. Float16 rows are upcast
+        with torch (see _upcast_similarities): the scan then costs about
+        1.3x a float32 one for a single query, for half the storage.
+        """
+        if self.embeddings.dtype == np.float16:
+            return _upcast_similarities(queries, self.embeddings)
+
+        queries = np.asarray(queries, dtype=np.float32)
+        num_rows = len(self.embeddings)
+        similarities = np.empty((len(queries), num_rows), dtype=np.float32)
+
+        for start in range(0, num_rows, self.chunk_size):
+            block = np.asarray(self.embeddings[start:start + self.chunk_size], dtype=np.float32)
+            similarities[:, start:start + len(block)] = queries @ block.T
+
+        return similarities
+
+
+class QuantizedIndex:
+    def __init__(self, dtype="int8", rescore=4, chunk_size=2048):
+        """
+        Scan a compact copy of the gallery, then rescore at full precision.
+
+        Args:
+            dtype (str): "float16", or "int8" (symmetric, one scale per row)
+            rescore (int): Rescore the best rescore * top_k candidates against
+                the original rows; 0 returns the compact-copy scores as-is
+            chunk_size (int): Rows quantized (and, for float16, upcast
+                during the scan) at a time
+        """
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"dtype must be float16 or int8, got {dtype}")
+
+        self.dtype = dtype
+        self.rescore = rescore
+        self.chunk_size = chunk_size
+        self.rows = None
+        self.codes = None
+        self.scales = None
+        self._packed = None
+        self.nbytes = 0  # RAM held by the compact copy (codes and scales)
+
+    def build(self, embeddings, rows=None):
+        """
+        Quantize the gallery chunk by chunk, keeping only the compact copy.
+
+        Args:
+            embeddings (np.ndarray): Gallery (N x D), float32 or float16,
+                in memory or memory-mapped
+            rows (np.ndarray | str): Memory-mapped full-precision rows for
+                rescoring, or the path of a saved .npy gallery (default:
+                `embeddings`, which must then be memory-mapped, e.g. from
+                EmbeddingIndex). Unused with rescore=0.
+        """
+        if self.rescore:
+            rows = embeddings if rows is None else rows
+            if isinstance(rows, (str, Path)):
+                rows = np.load(rows, mmap_mode="r")
+            if not isinstance(rows, np.memmap):
+                raise ValueError("Rescoring reads rows from disk: pass a memory-mapped gallery "
+                                 "(CLIPRetriever.load_index / EmbeddingIndex) or rows=<path to .npy>")
+        self.rows = rows if self.rescore else None
+
+        num_rows = len(embeddings)
+        codes = np.empty(embeddings.shape, dtype=self.dtype)
+        self.scales = np.ones(num_rows, dtype=np.float32) if self.dtype == "int8" else None
+
+        for start in range(0, num_rows, self.chunk_size):
+            block = np.asarray(embeddings[start:start + self.chunk_size], dtype=np.float32)
+            stop = start + len(block)
+
+            if self.dtype == "float16":
+                codes[start:stop] = block
+            else:
+                scales = np.abs(block).max(axis=1) / 127
+                scales[scales == 0] = 1
+                codes[start:stop] = np.round(block / scales[:, None])
+                self.scales[start:stop] = scales
+
+        # The packed int8 copy replaces the codes; keep them only as a fallback
+        self._packed = _pack_int8(codes, self.scales) if self.dtype == "int8" else None
+        self.codes = codes if self._packed is None else None
+        self.nbytes = codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        return self
+
+    def search(self, queries, top_k):
+        """Shortlist on the compact copy, rescore, and return (scores, indices)."""
+        queries = np.asarray(queries, dtype=np.float32)
+        approximate = self.similarities(queries)
+
+        shortlist = top_k_indices(approximate, max(top_k, self.rescore * top_k))
+        if self.rescore:
+            # One gather of the short-listed rows (paged in from disk) for all queries
+            rows = np.asarray(self.rows[shortlist.ravel()], dtype=np.float32)
+            shortlist_scores = np.einsum("qkd,qd->qk", rows.reshape(*shortlist.shape, -1), queries)
+        else:
+            shortlist_scores = np.take_along_axis(approximate, shortlist, axis=1)
+
+        best = top_k_indices(shortlist_scores, top_k)
+        return np.take_along_axis(shortlist_scores, best, axis=1), np.take_along_axis(shortlist, best, axis=1)
+
+    def similarities(self, queries):
+        """
+        Approximate scores (Q x N) from the compact copy.
+
+        int8 codes are scored by torch's int8 kernels (queries are
+        quantized on the fly); float16 codes by _upcast_similarities, one
+        query as a native half-precision product. Neither upcasts the
+        whole gallery to float32.
+        """
+        if self._packed is not None:
+            queries = torch.from_numpy(np.ascontiguousarray(queries, dtype=np.float32))
+            with torch.no_grad():
+                return torch.ops.quantized.linear_dynamic(queries, self._packed).numpy()
+
+        if self.dtype == "float16":
+            return _upcast_similarities(queries, self.codes, self.chunk_size, native_single_query=True)
+
+        # int8 without a usable quantized engine
+        similarities = _upcast_similarities(queries, self.codes, self.chunk_size)
+        similarities *= self.scales
+        return similarities
+
+
+class IVFIndex:
+    def __init__(self, nlist=256, nprobe=8, pq_subvectors=None, train_size=None,
+                 kmeans_iterations=20, seed=0):
+        """
+        Inverted-file index with an optional product-quantization mode.
+
+        Args:
+            nlist (int): Number of coarse clusters (inverted lists)
+            nprobe (int): Lists scanned per query; higher = better recall, slower
+            pq_subvectors (int): If set, store each vector as this many 1-byte
+                PQ codes (D must be divisible by it); None stores float32 rows
+            train_size (int): Vectors sampled to train k-means
+                (default: 64 per centroid, capped at N)
+            kmeans_iterations (int): Lloyd iterations for every k-means run
+            seed (int): Random seed
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_subvectors = pq_subvectors
+        self.train_size = train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self.centroids = None
+        self.list_offsets = None     # list i holds rows list_offsets[i]:list_offsets[i + 1]
+        self.list_ids = None         # original row index of every stored vector
+        self.list_vectors = None     # float32 rows, or uint8 PQ codes
+        self.codebooks = None        # (pq_subvectors x 256 x D/pq_subvectors)
+
+    def _training_sample(self, embeddings, k, rng):
+        size = self.train_size or 64 * k
+        size = max(k, min(size, len(embeddings)))
+        rows = np.sort(rng.choice(len(embeddings), size=size, replace=False))
+        return np.asarray(embeddings[rows], dtype=np.float32)
+
+    def build(self, embeddings):
+        """Train the coarse quantizer (and PQ codebooks), then fill the lists."""
+        num_rows, dim = embeddings.shape
+        if num_rows < self.nlist:
+            raise ValueError(f"Need at least nlist={self.nlist} vectors, got {num_rows}")
+        if self.pq_subvectors and dim % self.pq_subvectors:
+            raise ValueError(f"Dimension {dim} is not divisible by pq_subvectors={self.pq_subvectors}")
+
+        rng = np.random.default_rng(self.seed)
+        sample = self._training_sample(embeddings, self.nlist, rng)
+        self.centroids = kmeans(sample, self.nlist, self.kmeans_iterations, self.seed)
+
+        assignment = _assign(embeddings, self.centroids)
+        self.list_ids = np.argsort(assignment, kind="stable")
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=self.nlist))))
+
+        if self.pq_subvectors:
+            # PQ codes describe the residual from the list centroid
+            self._train_pq(sample - self.centroids[_assign(sample, self.centroids)])
+
+            # Encode in chunks so the float32 copy never exists in full
+            chunks = np.array_split(self.list_ids, max(1, num_rows // 65536))
+            self.list_vectors = np.concatenate([
+                self._pq_encode(np.asarray(embeddings[ids], dtype=np.float32) - self.centroids[assignment[ids]])
+                for ids in chunks
+            ])
+        else:
+            self.list_vectors = np.asarray(embeddings[self.list_ids], dtype=np.float32)
+
+        return self
+
+    def _train_pq(self, sample):
+        codes_per_subvector = min(256, len(sample))
+        sub_dim = sample.shape[1] // self.pq_subvectors
+        self.codebooks = np.stack([
+            kmeans(sample[:, j * sub_dim:(j + 1) * sub_dim], codes_per_subvector,
+                   self.kmeans_iterations, self.seed + j)
+            for j in range(self.pq_subvectors)
+        ])
+
+    def _pq_encode(self, vectors):
+        sub_dim = vectors.shape[1] // self.pq_subvectors
+        codes = np.empty((len(vectors), self.pq_subvectors), dtype=np.uint8)
+        for j, codebook in enumerate(self.codebooks):
+            codes[:, j] = _assign(vectors[:, j * sub_dim:(j + 1) * sub_dim], codebook)
+        return codes
+
+    def search(self, queries, top_k, nprobe=None):
+        """
+        Scan the nprobe closest lists per query and return (scores, indices).
+
+        Queries that find fewer than top_k candidates are padded with
+        index -1 and score -inf.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        queries = np.asarray(queries, dtype=np.float32)
+
+        probes = top_k_indices(queries @ self.centroids.T, nprobe)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), top_k), -1, dtype=np.int64)
+
+        for q, query in enumerate(queries):
+            lookup = self._pq_lookup(query) if self.codebooks is not None else None
+
+            # Probed lists are contiguous row ranges: score slice by slice
+            starts = self.list_offsets[probes[q]]
+            stops = self.list_offsets[probes[q] + 1]
+            candidates = np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)])
+            if len(candidates) == 0:
+                continue
+
+            candidate_scores = np.concatenate([
+                self._score(query, lookup, list_id)
+                for list_id in probes[q]
+            ])
+            best = top_k_indices(candidate_scores, top_k)
+            scores[q, :len(best)] = candidate_scores[best]
+            indices[q, :len(best)] = self.list_ids[candidates[best]]
+
+        return scores, indices
+
+    def _pq_lookup(self, query):
+        # Asymmetric distance table: query subvector . codeword,
+        # shape (pq_subvectors x 256)
+        sub_dim = len(query) // self.pq_subvectors
+        return np.einsum("jkd,jd->jk", self.codebooks, query.reshape(self.pq_subvectors, sub_dim))
+
+    def _score(self, query, lookup, list_id):
+        start, stop = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+        if lookup is None:
+            return self.list_vectors[start:stop] @ query
+
+        # q . x ~= q . centroid + sum of the residual codes' table entries
+        codes = self.list_vectors[start:stop]
+        return query @ self.centroids[list_id] + lookup[np.arange(self.pq_subvectors), codes].sum(axis=1)
@@ -0,0 +1,186 @@
+"""
+Persistent, incremental embedding index for the W17D4 demos
+
+Stores image embeddings on disk next to a manifest recording each file's
+path, mtime, size and content hash. Re-indexing a directory only encodes
+files that are new or whose contents changed, and drops deleted files,
+so a warm restart does not need the image encoder at all.
+
+Layout for an index at `outputs/clip_index`:
+    outputs/clip_index.npy   - embeddings (N x D), one fixed-width float32
+                               or float16 row per entry
+    outputs/clip_index.json  - manifest: model name, dtype + one entry
+                               (path, mtime, size, sha256) per row
+
+The .npy file is a small header followed by the raw rows, so it is
+opened with `np.load(..., mmap_mode="r")`: rows are paged in on demand
+and several processes opening the same index share one page-cached copy.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the hex SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EmbeddingIndex:
+    def __init__(self, index_path, model_name, dtype="float32", mmap=True):
+        """
+        Open (or start) the index stored at `index_path`.
+
+        An index built with a different model is ignored and rebuilt,
+        since its embeddings live in a different space.
+
+        Args:
+            index_path (str): Index location, without extension
+            model_name (str): Model the embeddings come from
+            dtype (str): Row type written on save ("float32" or "float16")
+            mmap (bool): Memory-map embeddings read-only instead of loading them
+        """
+        if np.dtype(dtype) not in (np.float32, np.float16):
+            raise ValueError(f"dtype must be float32 or float16, got {dtype}")
+
+        self.index_path = Path(index_path)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.mmap = mmap
+        self.entries = []
+        self.embeddings = None
+        self._load()
+
+    @property
+    def embeddings_file(self):
+        return self.index_path.with_suffix(".npy")
+
+    @property
+    def manifest_file(self):
+        return self.index_path.with_suffix(".json")
+
+    @property
+    def paths(self):
+        return [Path(entry["path"]) for entry in self.entries]
+
+    def _load(self):
+        if not (self.embeddings_file.exists() and self.manifest_file.exists()):
+            return
+
+        with open(self.manifest_file, "r") as f:
+            manifest = json.load(f)
+
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("model_name") != self.model_name:
+            print(f"Ignoring index at {self.index_path} (built for a different model or format)")
+            return
+
+        embeddings = self._open_embeddings()
+        if len(embeddings) != len(manifest["entries"]):
+            print(f"Ignoring index at {self.index_path} (manifest and embeddings disagree)")
+            return
+
+        self.entries = manifest["entries"]
+        self.embeddings = embeddings
+
+    def _open_embeddings(self):
+        return np.load(self.embeddings_file, mmap_mode="r" if self.mmap else None)
+
+    def update(self, image_paths, encode_fn):
+        """
+        Bring the index in line with `image_paths`.
+
+        Files whose mtime and size match the manifest are reused without
+        reading them. Otherwise the content hash decides: an unchanged hash
+        (e.g. a touched or renamed file) reuses the stored embedding, and
+        only genuinely new content is passed to `encode_fn`.
+
+        Args:
+            image_paths (list): Current image files, in the desired row order
+            encode_fn (callable): Maps a list of paths to an (N x D) array
+
+        Returns:
+            dict: Counts of reused, encoded and removed entries
+        """
+        by_path = {entry["path"]: i for i, entry in enumerate(self.entries)}
+        by_hash = {entry["sha256"]: i for i, entry in enumerate(self.entries)}
+
+        new_entries = []
+        sources = []      # row in the old embeddings, or None if it must be encoded
+        to_encode = []
+
+        for path in image_paths:
+            stat = os.stat(path)
+            entry = {"path": str(path), "mtime": stat.st_mtime, "size": stat.st_size}
+
+            old = by_path.get(entry["path"])
+            if old is not None and self.entries[old]["mtime"] == entry["mtime"] \
+                    and self.entries[old]["size"] == entry["size"]:
+                entry["sha256"] = self.entries[old]["sha256"]
+                sources.append(old)
+            else:
+                entry["sha256"] = file_sha256(path)
+                old = by_hash.get(entry["sha256"])
+                sources.append(old)
+                if old is None:
+                    to_encode.append(path)
+
+            new_entries.append(entry)
+
+        encoded = encode_fn(to_encode) if to_encode else None
+
+        # Assemble the new table with one gather from the old rows
+        # (which may be memory-mapped) and one scatter of the new ones
+        sources = np.array([-1 if source is None else source for source in sources], dtype=np.int64)
+        reused = sources >= 0
+        dim = encoded.shape[1] if encoded is not None else (
+            self.embeddings.shape[1] if self.embeddings is not None else 0)
+
+        rows = np.empty((len(sources), dim), dtype=self.dtype)
+        if reused.any():
+            rows[reused] = self.embeddings[sources[reused]]
+        if encoded is not None:
+            rows[~reused] = encoded
+
+        stats = {
+            "reused": int(reused.sum()),
+            "encoded": len(to_encode),
+            "removed": len(self.entries) - len(np.unique(sources[reused])),
+        }
+
+        self.entries = new_entries
+        self.embeddings = rows if len(rows) else None
+        return stats
+
+    def save(self):
+        """Write embeddings and manifest, replacing any previous version."""
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_embeddings = self.embeddings_file.with_suffix(".tmp.npy")
+        tmp_manifest = self.manifest_file.with_suffix(".tmp.json")
+
+        embeddings = self.embeddings if self.embeddings is not None else np.zeros((0, 0))
+        np.save(tmp_embeddings, np.ascontiguousarray(embeddings, dtype=self.dtype))
+        with open(tmp_manifest, "w") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "model_name": self.model_name,
+                "dtype": self.dtype.name,
+                "entries": self.entries,
+            }, f, indent=2)
+
+        # os.replace keeps existing mappings of the old file valid
+        os.replace(tmp_embeddings, self.embeddings_file)
+        os.replace(tmp_manifest, self.manifest_file)
+
+        if self.mmap and self.embeddings is not None:
+            self.embeddings = self._open_embeddings()
@@ -0,0 +1,89 @@
+"""
+Parallel image loading for the W17D4 demos
+
+A small thread pool decodes and preprocesses images while the model
+encodes the previous batch. Finished batches wait on a bounded queue,
+so at most `queue_depth` batches are held in memory at any time.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Marks the end of the stream on the queue
+_DONE = object()
+
+
+def load_rgb(image_path):
+    """Open an image file and decode it as RGB."""
+    return Image.open(image_path).convert("RGB")
+
+
+def iter_preprocessed_batches(image_paths, preprocess, batch_size=16,
+                              num_workers=4, queue_depth=4):
+    """
+    Yield preprocessed image batches, decoding ahead of the consumer.
+
+    Args:
+        image_paths (list): Image files to load, in order
+        preprocess (callable): Maps one image path to a numpy array
+            (e.g. decoded, resized and normalized pixel values)
+        batch_size (int): Number of images per yielded batch
+        num_workers (int): Decode threads; 0 decodes inline, no pipeline
+        queue_depth (int): Maximum number of ready batches kept in memory
+
+    Yields:
+        tuple: (batch_paths, batch_array) with batch_array stacked on axis 0
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+
+    batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+
+    if num_workers == 0:
+        for batch_paths in batches:
+            yield batch_paths, np.stack([preprocess(p) for p in batch_paths])
+        return
+
+    ready = queue.Queue(maxsize=max(1, queue_depth))
+    stop = threading.Event()
+
+    def put(item):
+        # Block while the queue is full, but give up if the consumer left
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers) as pool:
+                for batch_paths in batches:
+                    arrays = list(pool.map(preprocess, batch_paths))
+                    if not put((batch_paths, np.stack(arrays))):
+                        return
+        except Exception as e:
+            put(e)
+            return
+        put(_DONE)
+
+    producer = threading.Thread(target=produce, name="image-loader", daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = ready.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
@@ -0,0 +1,106 @@
+"""
+Process-wide model registry for the W17D4 demos
+
+Wrappers ask the registry for their model instead of calling
+from_pretrained themselves. The first request for a key loads the model;
+later requests for the same (kind, model name, device, dtype) return the
+same instance, so constructing several wrappers never reloads weights.
+Models can be unloaded explicitly to free memory.
+"""
+
+import gc
+import threading
+
+import torch
+
+_models = {}
+_key_locks = {}
+_lock = threading.Lock()
+
+
+def default_device():
+    """Return "cuda" if a GPU is available, else "cpu"."""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _make_key(kind, model_name, device, dtype):
+    return (kind, model_name, device or default_device(), str(dtype) if dtype is not None else None)
+
+
+def get_model(kind, model_name, loader, device=None, dtype=None):
+    """
+    Return the shared model for a key, loading it on first use.
+
+    Args:
+        kind (str): What is loaded, e.g. "clip" (keeps different wrappers
+            of the same checkpoint apart)
+        model_name (str): Hugging Face model identifier
+        loader (callable): loader(model_name, device, dtype) -> model object;
+            only called if the key is not loaded yet
+        device (str): Target device (default: cuda if available, else cpu)
+        dtype (torch.dtype): Weight dtype, or None for the checkpoint default
+    """
+    key = _make_key(kind, model_name, device, dtype)
+
+    with _lock:
+        if key in _models:
+            return _models[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Load outside the global lock so different models can load in parallel;
+    # the per-key lock stops two threads loading the same one
+    with key_lock:
+        with _lock:
+            if key in _models:
+                return _models[key]
+
+        model = loader(model_name, key[2], dtype)
+
+        with _lock:
+            _models[key] = model
+        return model
+
+
+def is_loaded(kind, model_name, device=None, dtype=None):
+    """Return True if the key is currently loaded."""
+    with _lock:
+        return _make_key(kind, model_name, device, dtype) in _models
+
+
+def loaded_models():
+    """List the keys of all loaded models."""
+    with _lock:
+        return list(_models)
+
+
+def unload_model(kind, model_name, device=None, dtype=None):
+    """
+    Drop a model from the registry and free its memory.
+
+    Wrappers holding the model still keep it alive until they are gone.
+
+    Returns:
+        bool: True if the model was loaded
+    """
+    with _lock:
+        model = _models.pop(_make_key(kind, model_name, device, dtype), None)
+
+    if model is None:
+        return False
+
+    del model
+    _free_memory()
+    return True
+
+
+def unload_all():
+    """Drop every model from the registry."""
+    with _lock:
+        _models.clear()
+    _free_memory()
+
+
+def _free_memory():
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
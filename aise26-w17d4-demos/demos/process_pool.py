@@ -0,0 +1,163 @@
+"""
+Process-pool runner for CPU-bound model work
+
+One PyTorch process does not keep a many-core CPU busy on small batches.
+ProcessPoolRunner starts N worker processes. Each one builds its wrapper
+(CLIPRetriever, ImageCaptioner, AudioTranscriber, ...) once in the pool
+initializer, loads the model there, and limits torch to its share of the
+cores so workers do not oversubscribe each other. Work is then sent in
+chunks, and results come back in input order.
+
+PooledWrapper gives a wrapper one such pool, started by its first
+multi-process call and reused by the next ones until close().
+
+Workers use the "spawn" start method, so scripts using the runner need
+an `if __name__ == "__main__":` guard (all demos have one).
+"""
+
+import math
+import multiprocessing
+import os
+
+import torch
+
+# Per-process wrapper, built by _init_worker
+_worker = None
+_init_error = None
+
+
+def available_cores():
+    """CPU cores this process may run on (respects affinity / cgroup pinning)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def warm_up(worker):
+    """Default warm start: touch the wrapper's lazily loaded model."""
+    for attr in ("model", "asr"):
+        if hasattr(type(worker), attr):
+            getattr(worker, attr)
+
+
+def _init_worker(factory, threads, warmup):
+    global _worker, _init_error
+    torch.set_num_threads(threads)
+    # A failing initializer makes Pool respawn workers forever, so keep the
+    # error and raise it from the first task instead
+    try:
+        _worker = factory()
+        if warmup is not None:
+            warmup(_worker)
+    except Exception as e:
+        _init_error = e
+
+
+def _run_chunk(task):
+    if _init_error is not None:
+        raise RuntimeError(f"Worker failed to start: {_init_error!r}")
+    fn, chunk = task
+    return list(fn(_worker, chunk))
+
+
+class ProcessPoolRunner:
+    def __init__(self, factory, num_workers=None, threads_per_worker=None, warmup=warm_up):
+        """
+        Start the worker pool.
+
+        Args:
+            factory (callable): Picklable zero-argument callable that builds
+                the worker's wrapper, e.g. functools.partial(ImageCaptioner, name)
+            num_workers (int): Worker processes (default: one per 4 cores)
+            threads_per_worker (int): torch intra-op threads per worker
+                (default: available cores // num_workers)
+            warmup (callable): warmup(wrapper), run once per worker after
+                construction (default: load the model)
+        """
+        cores = available_cores()
+        self.num_workers = num_workers or max(1, cores // 4)
+        self.threads_per_worker = threads_per_worker or max(1, cores // self.num_workers)
+
+        context = multiprocessing.get_context("spawn")
+        self._pool = context.Pool(
+            self.num_workers,
+            initializer=_init_worker,
+            initargs=(factory, self.threads_per_worker, warmup)
+        )
+
+    def map(self, fn, items, chunksize=None):
+        """
+        Run fn over items in chunks on the workers.
+
+        Args:
+            fn (callable): Picklable module-level fn(wrapper, chunk) returning
+                one result per item of the chunk
+            items (list): Work items (paths, ...)
+            chunksize (int): Items per task (default: spread evenly, ~4
+                tasks per worker)
+
+        Returns:
+            list: One result per item, in input order
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        chunksize = chunksize or math.ceil(len(items) / (self.num_workers * 4))
+        tasks = [(fn, items[i:i + chunksize]) for i in range(0, len(items), chunksize)]
+
+        results = []
+        for chunk_results in self._pool.imap(_run_chunk, tasks):
+            results.extend(chunk_results)
+        return results
+
+    def close(self):
+        """Stop the workers."""
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._pool.terminate()
+        self.close()
+
+
+class PooledWrapper:
+    """
+    Mixin for wrappers that can hand their work to worker processes.
+
+    process_pool(n) starts a ProcessPoolRunner of n workers on first use
+    (each building its own wrapper from worker_factory()) and returns the
+    same runner on later calls, so workers load their model once rather
+    than once per call. Asking for a different number of workers restarts
+    the pool. close() stops it; wrappers are also context managers.
+    """
+
+    _runner = None
+
+    def worker_factory(self):
+        """Picklable zero-argument callable building this wrapper in a worker."""
+        raise NotImplementedError
+
+    def process_pool(self, processes):
+        """Return the wrapper's pool of `processes` workers, starting it if needed."""
+        if self._runner is not None and self._runner.num_workers != processes:
+            self.close()
+        if self._runner is None:
+            self._runner = ProcessPoolRunner(self.worker_factory(), num_workers=processes)
+        return self._runner
+
+    def close(self):
+        """Stop the worker processes, if any were started."""
+        if self._runner is not None:
+            self._runner.close()
+            self._runner = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,77 @@
+"""
+Pre-inference quality gate
+
+Cheap input checks that run before a model is called. Inputs that fail
+(near-black or blown-out images, silent or too-short audio) get the
+fallback response straight away instead of a generate()/ASR call whose
+output would be labelled "Low" confidence anyway.
+"""
+
+
+class QualityGate:
+    def __init__(self, min_brightness=10.0, max_brightness=250.0, min_image_quality=0.0,
+                 min_rms=0.001, min_duration=0.5, max_duration=None,
+                 image_fallback="Image quality too low to caption reliably",
+                 audio_fallback="Audio quality too low to transcribe reliably"):
+        """
+        Create a gate with rejection thresholds.
+
+        Args:
+            min_brightness (float): Minimum grayscale brightness (0-255)
+            max_brightness (float): Maximum grayscale brightness (0-255)
+            min_image_quality (float): Minimum image_quality.quality_score (0 = off)
+            min_rms (float): Minimum RMS energy of the waveform
+            min_duration (float): Minimum audio length in seconds
+            max_duration (float): Maximum audio length in seconds (None = no limit)
+            image_fallback (str): Caption returned for rejected images
+            audio_fallback (str): Text returned for rejected audio
+        """
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_image_quality = min_image_quality
+        self.min_rms = min_rms
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.image_fallback = image_fallback
+        self.audio_fallback = audio_fallback
+
+    def check_image(self, stats):
+        """
+        Check image statistics against the thresholds.
+
+        Args:
+            stats (dict): Output of ImageCaptioner.caption_with_stats' stats
+                (needs "luminance"; "quality_score" if min_image_quality is set)
+
+        Returns:
+            list: Reasons the image was rejected (empty if it passes)
+        """
+        reasons = []
+        brightness = stats["luminance"]
+
+        if brightness < self.min_brightness:
+            reasons.append(f"too dark (brightness {brightness:.1f} < {self.min_brightness})")
+        if brightness > self.max_brightness:
+            reasons.append(f"overexposed (brightness {brightness:.1f} > {self.max_brightness})")
+        if self.min_image_quality and stats["quality_score"] < self.min_image_quality:
+            reasons.append(f"low quality score ({stats['quality_score']:.2f} < {self.min_image_quality})")
+
+        return reasons
+
+    def check_audio(self, duration, rms_energy):
+        """
+        Check audio duration and energy against the thresholds.
+
+        Returns:
+            list: Reasons the audio was rejected (empty if it passes)
+        """
+        reasons = []
+
+        if duration < self.min_duration:
+            reasons.append(f"too short ({duration:.2f}s < {self.min_duration}s)")
+        if self.max_duration is not None and duration > self.max_duration:
+            reasons.append(f"too long ({duration:.2f}s > {self.max_duration}s)")
+        if rms_energy < self.min_rms:
+            reasons.append(f"too quiet (RMS {rms_energy:.4f} < {self.min_rms})")
+
+        return reasons
@@ -0,0 +1,85 @@
+"""
+LRU cache for text-query embeddings
+
+Popular queries are encoded once and served from memory afterwards.
+Entries are keyed by (model name, normalized query), so one cache can be
+shared by retrievers running different models.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(text):
+    """Lowercase and collapse whitespace (CLIP's tokenizer does the same)."""
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        Create a bounded LRU cache.
+
+        Args:
+            max_size (int): Maximum number of embeddings kept
+            ttl (float): Seconds an entry stays valid (None = no expiry)
+        """
+        if max_size < 1:
+            raise ValueError(f"max_size must be >= 1, got {max_size}")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name, query):
+        """Return the cached embedding for a query, or None on a miss."""
+        key = (model_name, normalize_query(query))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, model_name, query, embedding):
+        """Store an embedding, evicting the least recently used entry if full."""
+        key = (model_name, normalize_query(query))
+        embedding = embedding.copy()
+        embedding.flags.writeable = False
+
+        with self._lock:
+            self._entries[key] = (embedding, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
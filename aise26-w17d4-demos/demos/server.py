@@ -0,0 +1,401 @@
+"""
+Async HTTP inference server with dynamic micro-batching
+
+Serves the three demo pipelines over HTTP/JSON using only the standard
+library (asyncio streams):
+
+    POST /search      {"query": "a dog", "top_k": 5}  -> {"results": [[path, score], ...]}
+    POST /caption     {"image_path": "..."}          -> {"caption": "..."}
+    POST /transcribe  {"audio_path": "..."}          -> {"text": "...", ...}
+    GET  /health                                     -> {"status": "ok", "batching": {...}}
+    GET  /metrics                                    -> per-stage latency histograms
+                                                        (Prometheus text, see tracing.py)
+
+Concurrent requests to an endpoint are collected into micro-batches: a
+batch is dispatched when it reaches `max_batch_size` or when its oldest
+request has waited `max_wait_ms`. Batches run on a single worker thread
+(search_batch / caption_batch / transcribe_batch), so the event loop never
+blocks on torch and model calls never compete for cores.
+
+Usage:
+    python demos/server.py --port 8000 --max-batch-size 16 --max-wait-ms 10
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import tracing
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, executor, max_batch_size=16, max_wait_ms=5.0):
+        """
+        Collect single requests into batches for `run_batch`.
+
+        A request only fails because of its own input: a result that is an
+        Exception fails just that request, and if run_batch raises for a
+        batch of several items, the items are retried one at a time.
+
+        Args:
+            run_batch (callable): run_batch(items) -> list of results (or
+                Exceptions), one per item, in order; called on `executor`
+            executor (Executor): Where batches run (keep torch off the loop)
+            max_batch_size (int): Dispatch as soon as this many are waiting
+            max_wait_ms (float): Dispatch once the oldest request waited this long
+        """
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.items = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, item):
+        """Queue one item and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [item for item, _ in batch]
+            self.batches += 1
+            self.items += len(items)
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.run_batch, items)
+            except Exception as e:
+                results = [e] if len(items) == 1 else await loop.run_in_executor(self.executor, self._run_each, items)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _run_each(self, items):
+        """Run items as batches of one, so a bad input fails only itself."""
+        results = []
+        for item in items:
+            try:
+                results.extend(self.run_batch([item]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class InferenceServer:
+    def __init__(self, retriever=None, captioner=None, transcriber=None,
+                 max_batch_size=16, max_wait_ms=5.0, caption_max_length=50):
+        """
+        Create the server; endpoints exist only for the components given.
+
+        Args:
+            retriever (CLIPRetriever): Indexed retriever for /search
+            captioner (ImageCaptioner): Captioner for /caption
+            transcriber (AudioTranscriber): Transcriber for /transcribe
+            max_batch_size (int): Largest micro-batch per endpoint
+            max_wait_ms (float): Longest a request waits for batch-mates
+            caption_max_length (int): max_length for every caption
+        """
+        self.retriever = retriever
+        self.captioner = captioner
+        self.transcriber = transcriber
+        self.caption_max_length = caption_max_length
+
+        # One thread: batches from all endpoints run one at a time
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.batchers = {}
+        if retriever is not None:
+            self.batchers["/search"] = MicroBatcher(self._search_batch, self.executor, max_batch_size, max_wait_ms)
+        if captioner is not None:
+            self.batchers["/caption"] = MicroBatcher(self._caption_batch, self.executor, max_batch_size, max_wait_ms)
+        if transcriber is not None:
+            self.batchers["/transcribe"] = MicroBatcher(
+                self._transcribe_batch, self.executor, max_batch_size, max_wait_ms
+            )
+
+        self._server = None
+        self.port = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start listening; port 0 picks a free port. Returns the bound port."""
+        for batcher in self.batchers.values():
+            batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.executor.shutdown(wait=True)
+
+    async def serve_forever(self, host="127.0.0.1", port=8000):
+        await self.start(host, port)
+        print(f"Serving on http://{host}:{self.port} ({', '.join(self.batchers)})")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    # Batch handlers (run on the worker thread)
+
+    def _search_batch(self, items):
+        top_k = max(item["top_k"] for item in items)
+        results = self.retriever.search_batch([item["query"] for item in items], top_k=top_k)
+        return [
+            {"results": [[path, score] for path, score in rows[:item["top_k"]]]}
+            for item, rows in zip(items, results)
+        ]
+
+    def _caption_batch(self, items):
+        captions = self.captioner.caption_batch(
+            [item["image_path"] for item in items],
+            max_length=self.caption_max_length,
+            batch_size=len(items),
+            num_workers=0
+        )
+        return [{"caption": caption} for caption in captions]
+
+    def _transcribe_batch(self, items):
+        results = self.transcriber.transcribe_batch(
+            [item["audio_path"] for item in items],
+            batch_size=len(items),
+            num_workers=1
+        )
+        # transcribe_batch reports unreadable files per item
+        return [RuntimeError(result["error"]) if "error" in result else result for result in results]
+
+    # HTTP
+
+    def _parse(self, path, body):
+        """Validate a request body into a batch item (raises ValueError)."""
+        request = json.loads(body or b"{}")
+        if not isinstance(request, dict):
+            raise ValueError("Request body must be a JSON object")
+
+        if path == "/search":
+            if not isinstance(request.get("query"), str):
+                raise ValueError("'query' (string) is required")
+            top_k = request.get("top_k", 5)
+            if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1:
+                raise ValueError("'top_k' must be a positive integer")
+            return {"query": request["query"], "top_k": top_k}
+
+        field = "image_path" if path == "/caption" else "audio_path"
+        if not isinstance(request.get(field), str):
+            raise ValueError(f"'{field}' (string) is required")
+        if not Path(request[field]).exists():
+            raise ValueError(f"File not found: {request[field]}")
+        return {field: request[field]}
+
+    async def _dispatch(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {
+                "status": "ok",
+                "batching": {name: batcher.stats() for name, batcher in self.batchers.items()}
+            }
+        if method == "GET" and path == "/metrics":
+            return 200, tracing.tracer.to_prometheus()
+
+        batcher = self.batchers.get(path)
+        if method != "POST" or batcher is None:
+            return 404, {"error": f"No endpoint {method} {path}"}
+
+        try:
+            item = self._parse(path, body)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+
+        try:
+            return 200, await batcher.submit(item)
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload = await self._dispatch(method, path, body)
+
+                if isinstance(payload, str):
+                    data, content_type = payload.encode(), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload).encode(), "application/json"
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+class InferenceClient:
+    def __init__(self, host="127.0.0.1", port=8000):
+        """Minimal async JSON client (one connection per request)."""
+        self.host = host
+        self.port = port
+
+    async def request(self, method, path, payload=None):
+        """Send a request; returns (status, decoded JSON body, or text for /metrics)."""
+        body = json.dumps(payload).encode() if payload is not None else b""
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            data = await reader.readexactly(int(headers.get("content-length", 0)))
+            if headers.get("content-type", "").startswith("text/plain"):
+                return status, data.decode()
+            return status, json.loads(data)
+        finally:
+            writer.close()
+
+    async def search(self, query, top_k=5):
+        return await self.request("POST", "/search", {"query": query, "top_k": top_k})
+
+    async def caption(self, image_path):
+        return await self.request("POST", "/caption", {"image_path": str(image_path)})
+
+    async def transcribe(self, audio_path):
+        return await self.request("POST", "/transcribe", {"audio_path": str(audio_path)})
+
+    async def health(self):
+        return await self.request("GET", "/health")
+
+    async def metrics(self):
+        return await self.request("GET", "/metrics")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async inference server for the W17D4 demos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--image-dir",
+        default=str(Path(__file__).parent.parent / "data" / "images"),
+        help="Images indexed for /search"
+    )
+    parser.add_argument(
+        "--index-path",
+        default=str(Path(__file__).parent.parent / "outputs" / "clip_index"),
+        help="Persistent CLIP index (only new or changed images are encoded)"
+    )
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument(
+        "--no-audio",
+        action="store_true",
+        help="Do not serve /transcribe (skips the Whisper dependencies)"
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Record per-stage latencies, served at GET /metrics"
+    )
+
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable()
+
+    # Demo modules start with digits, so import them by name
+    retriever = importlib.import_module("01_clip_retrieval").CLIPRetriever()
+    retriever.index_images(args.image_dir, index_path=args.index_path)
+    captioner = importlib.import_module("02_image_captioning").ImageCaptioner()
+    transcriber = None if args.no_audio else importlib.import_module("03_whisper_transcription").AudioTranscriber()
+
+    server = InferenceServer(
+        retriever=retriever,
+        captioner=captioner,
+        transcriber=transcriber,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms
+    )
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        sys.exit(0)
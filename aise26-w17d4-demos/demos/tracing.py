@@ -0,0 +1,206 @@
+"""
+Per-stage latency tracing for the demo pipelines
+
+Pipelines wrap each stage (decode, preprocess, copy, forward,
+postprocess) in a span:
+
+    with tracing.span("caption_image", "forward"):
+        outputs = model.generate(...)
+
+Spans are timed with time.perf_counter (monotonic) and aggregated into
+one fixed-bucket histogram per (pipeline, stage). No per-call records
+are kept, so memory stays constant however long the process runs.
+
+Tracing is off by default. A disabled span() is one flag check that
+returns a shared no-op context manager. Enable it with tracing.enable(),
+or set W17D4_TRACE=1 (worker processes inherit the variable).
+
+    tracing.enable()
+    ...
+    print(tracing.tracer.to_prometheus())
+    tracing.tracer.write("outputs/trace.json")
+"""
+
+import os
+import json
+import math
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+# Upper bucket bounds in seconds (Prometheus "le"), plus an implicit +Inf
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Latency histogram with fixed bucket bounds (seconds)."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile (0-1) by linear interpolation inside its bucket,
+        as Prometheus' histogram_quantile does, clamped to the observed
+        min/max.
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / n
+                return min(max(estimate, self.min), self.max)
+            seen += n
+        return self.max
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+
+        return {
+            "count": self.count,
+            "total_ms": self.sum * 1000,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            "min_ms": self.min * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+            "p50_ms": self.quantile(0.50) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+            "buckets": buckets,
+        }
+
+
+class _Span:
+    __slots__ = ("tracer", "key", "start")
+
+    def __init__(self, tracer, key):
+        self.tracer = tracer
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class Tracer:
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        """
+        Collect span timings into per-(pipeline, stage) histograms.
+
+        Thread-safe: spans may be recorded from decode worker threads.
+        """
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def span(self, pipeline, stage):
+        """Context manager timing one stage of a pipeline call."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, (pipeline, stage))
+
+    def observe(self, key, seconds):
+        """Record a duration for key = (pipeline, stage)."""
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: {pipeline: {stage: histogram summary}}, sorted by name
+        """
+        with self._lock:
+            items = sorted(self._histograms.items())
+            summary = {}
+            for (pipeline, stage), histogram in items:
+                summary.setdefault(pipeline, {})[stage] = histogram.to_dict()
+        return summary
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, metric="pipeline_stage_seconds"):
+        """Render all histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {metric} Latency of pipeline stages in seconds.",
+            f"# TYPE {metric} histogram",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for (pipeline, stage), histogram in items:
+                labels = f'pipeline="{pipeline}",stage="{stage}"'
+                cumulative = 0
+                for bound, n in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{labels}}} {histogram.sum!r}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write to `path`: Prometheus text for .prom/.txt, JSON otherwise."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = self.to_prometheus() if path.suffix in (".prom", ".txt") else self.to_json()
+        path.write_text(text)
+
+
+# Process-wide tracer used by the demo pipelines
+tracer = Tracer(enabled=os.environ.get("W17D4_TRACE", "") not in ("", "0"))
+
+
+def span(pipeline, stage):
+    """Time one stage on the process-wide tracer."""
+    return tracer.span(pipeline, stage)
+
+
+def enable():
+    tracer.enabled = True
+
+
+def disable():
+    tracer.enabled = False
+
+
+def record(pipeline, stage, seconds):
+    """Record a duration measured elsewhere (no-op while disabled)."""
+    if tracer.enabled:
+        tracer.observe((pipeline, stage), seconds)
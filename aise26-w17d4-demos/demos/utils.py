@@ -47,18 +47,75 @@ def create_placeholder_image(path, label):
     img.save(path)
 
 
-def calculate_image_stats(image_path):
-    """Calculate basic statistics for an image."""
-    img = Image.open(image_path).convert('RGB')
-    arr = np.array(img)
+# ITU-R 601-2 luma weights, as used by PIL's convert('L')
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+
+def image_stats(rgb):
+    """
+    Calculate quality statistics from an already decoded RGB image.
+
+    One 256-bin histogram per channel gives the mean/std/min/max of all
+    pixel values and the luminance (the mean of PIL's grayscale
+    conversion), so no float image or grayscale conversion is made. It is
+    not copy-free: np.bincount casts each channel to an int64 copy (8
+    bytes per pixel, one channel at a time), so the pixels are read in
+    three passes.
+    """
+    arr = np.asarray(rgb)
+    if arr.dtype != np.uint8 or arr.ndim != 3 or arr.shape[-1] != 3:
+        raise ValueError(f"Expected an H x W x 3 uint8 array, got {arr.dtype} {arr.shape}")
+
+    pixels = arr.reshape(-1, 3)
+    channel_hist = np.stack([np.bincount(pixels[:, c], minlength=256) for c in range(3)])
+    hist = channel_hist.sum(axis=0)
+
+    values = np.arange(256)
+    channel_means = channel_hist @ values / len(pixels)
+    mean = channel_means.mean()
+    std = np.sqrt(max((hist @ values ** 2) / hist.sum() - mean ** 2, 0.0))
+    nonzero = np.flatnonzero(hist)
 
     return {
-        "mean_brightness": arr.mean(),
-        "std_brightness": arr.std(),
-        "shape": arr.shape
+        "shape": arr.shape,
+        "mean_brightness": float(mean),
+        "std_brightness": float(std),
+        "min_value": int(nonzero[0]),
+        "max_value": int(nonzero[-1]),
+        "luminance": float(channel_means @ LUMA_WEIGHTS),
     }
 
 
+def calculate_image_stats(image_path):
+    """Calculate basic statistics for an image."""
+    img = Image.open(image_path).convert('RGB')
+    return image_stats(np.asarray(img))
+
+
+def top_k_indices(scores, k):
+    """
+    Return the indices of the k highest scores, best first.
+
+    np.argpartition selects the k winners in O(N); only those k are then
+    sorted, instead of sorting every score. Works on a 1-D array, or
+    row-wise on a 2-D (queries x items) array.
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[-1]
+    k = max(0, min(k, n))
+
+    if k == 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < n:
+        candidates = np.argpartition(scores, n - k, axis=-1)[..., n - k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-candidate_scores, axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
@@ -0,0 +1,131 @@
+"""
+Energy / zero-crossing voice activity detection
+
+Splits a 16 kHz waveform into speech segments so silence never reaches
+the ASR model. Frame features are computed for the whole waveform at
+once (strided frame view, no copies), and segments come from run-length
+boundaries of the speech mask.
+
+A frame is speech when its RMS energy clears an adaptive threshold (a
+multiple of the file's noise floor, never below an absolute minimum).
+Frames that only just clear it but have a very high zero-crossing rate
+are treated as hiss rather than voice.
+
+pack_segments groups the segments into <= 30 s windows, so Whisper sees
+one padded window per 30 s of speech rather than one per segment.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def frame_features(audio, frame_length=400, hop_length=160):
+    """
+    Per-frame RMS energy and zero-crossing rate.
+
+    Defaults are 25 ms frames every 10 ms at 16 kHz.
+
+    Returns:
+        tuple: (rms, zcr) arrays with one value per frame
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if len(audio) < frame_length:
+        audio = np.pad(audio, (0, frame_length - len(audio)))
+
+    frames = sliding_window_view(audio, frame_length)[::hop_length]
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame_length)
+
+    signs = np.signbit(audio)
+    crossings = np.concatenate([[0], np.cumsum(signs[1:] != signs[:-1])])
+    starts = np.arange(len(frames)) * hop_length
+    zcr = (crossings[starts + frame_length - 1] - crossings[starts]) / (frame_length - 1)
+
+    return rms, zcr
+
+
+def speech_segments(audio, sr=16000, min_energy=0.001, noise_ratio=3.0, max_zcr=0.35,
+                    min_speech_s=0.25, min_silence_s=0.3, pad_s=0.1):
+    """
+    Find speech in a waveform.
+
+    Args:
+        audio (np.ndarray): Mono waveform
+        sr (int): Sample rate
+        min_energy (float): Absolute RMS floor for speech
+        noise_ratio (float): Speech must be this many times the noise floor
+            (10th percentile of frame RMS)
+        max_zcr (float): Frames with a higher zero-crossing rate need twice
+            the energy threshold (hiss / fricative noise)
+        min_speech_s (float): Drop speech runs shorter than this
+        min_silence_s (float): Merge speech runs separated by less than this
+        pad_s (float): Padding added around each segment
+
+    Returns:
+        list: (start_s, end_s) tuples in seconds, in order
+    """
+    hop_length = int(sr * 0.010)
+    rms, zcr = frame_features(audio, frame_length=int(sr * 0.025), hop_length=hop_length)
+
+    threshold = max(min_energy, noise_ratio * np.percentile(rms, 10))
+    speech = (rms > threshold) & ((zcr <= max_zcr) | (rms > 2 * threshold))
+
+    # Run boundaries of the speech mask: starts at +1 steps, ends at -1 steps
+    edges = np.diff(np.concatenate([[0], speech.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return []
+
+    # Close short gaps, then drop short bursts
+    gaps = starts[1:] - ends[:-1]
+    keep = np.concatenate([[True], gaps * hop_length >= min_silence_s * sr])
+    starts = starts[keep]
+    ends = np.concatenate([ends[:-1][keep[1:]], ends[-1:]])
+
+    long_enough = (ends - starts) * hop_length >= min_speech_s * sr
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    duration = len(audio) / sr
+    frame_s = hop_length / sr
+    return [
+        (max(0.0, float(start * frame_s - pad_s)), min(duration, float(end * frame_s + pad_s)))
+        for start, end in zip(starts, ends)
+    ]
+
+
+def pack_segments(segments, max_window_s=30.0, gap_s=0.3):
+    """
+    Group consecutive speech segments into windows of at most `max_window_s`.
+
+    Whisper pads every input to a 30 s window, so transcribing each short
+    segment on its own costs a full window per segment. Packing them
+    (with `gap_s` of silence between segments) needs only about
+    speech / 30 s windows. Segments longer than a window are split into
+    window-sized pieces, so a word may be cut at a piece boundary.
+
+    Args:
+        segments (list): (start_s, end_s) tuples from speech_segments
+        max_window_s (float): Longest packed window, in seconds
+        gap_s (float): Silence inserted between packed segments
+
+    Returns:
+        list: Windows, each a list of (start_s, end_s) segments in order
+    """
+    pieces = []
+    for start, end in segments:
+        while end - start > max_window_s:
+            pieces.append((start, start + max_window_s))
+            start += max_window_s
+        pieces.append((start, end))
+
+    windows = []
+    length = 0.0
+    for start, end in pieces:
+        added = end - start
+        if windows and length + gap_s + added <= max_window_s:
+            windows[-1].append((start, end))
+            length += gap_s + added
+        else:
+            windows.append([(start, end)])
+            length = added
+    return windows
@@ -1,154 +1,556 @@
 """
 Main pipeline entry point for W17D4 Assignment
 
-This is skeleton code. Students should implement the TODOs below.
+Implements the three tracks: CLIP retrieval (index_images, search), BLIP
+captioning (caption_image) and Whisper transcription (transcribe_audio),
+plus a command line for each mode:
+
+    python main.py --mode index --image-dir ../data/images
+    python main.py --mode search --query "a dog in a park"
+    python main.py --mode caption --image ../data/images/dog_clear.jpg
+    python main.py --mode transcribe --audio ../data/audio/short_clip.wav
 """
 
 import argparse
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoProcessor, GenerationConfig, WhisperProcessor
+
+from models import BLIPModel, CLIPModel, WhisperModel, map_in_processes, sequence_confidences
+from utils import (
+    DEFAULT_CACHE_DIR,
+    OutputCache,
+    content_digest,
+    create_fallback_message,
+    file_digest,
+    image_quality_score,
+    load_audio,
+    format_output,
+    load_embeddings,
+    load_image,
+    normalize_embedding,
+    normalize_query,
+    save_embeddings,
+    top_k_indices,
+    trace_span,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+DEFAULT_MODELS = {
+    "index": "openai/clip-vit-base-patch32",
+    "search": "openai/clip-vit-base-patch32",
+    "caption": "Salesforce/blip-image-captioning-base",
+    "transcribe": "openai/whisper-base",
+}
+DEFAULT_IMAGE_DIR = Path(__file__).resolve().parent.parent / "data" / "images"
+CAPTION_MAX_LENGTH = 50
+SAMPLE_RATE = 16000
+# Whisper's encoder sees at most 30 s of audio per input
+WHISPER_WINDOW = 30 * SAMPLE_RATE
+
+
+def model_track(model_name):
+    """
+    Find the track of a model from its config.
+
+    Args:
+        model_name (str): Hugging Face model identifier or local path
 
-def load_model(model_name):
+    Returns:
+        str: "clip", "blip" or "whisper"
+    """
+    model_type = AutoConfig.from_pretrained(model_name).model_type
+    if model_type not in ("clip", "blip", "whisper"):
+        raise ValueError(f"Unsupported model type '{model_type}' for {model_name}")
+    return model_type
+
+
+def load_model(model_name, torch_dtype=None):
     """
     Load the model for your chosen track.
 
-    TODO: Implement model loading
-    - For Track A (CLIP): Load CLIPModel and CLIPProcessor
-    - For Track B (BLIP): Load BlipProcessor and BlipForConditionalGeneration
-    - For Track C (Whisper): Load WhisperProcessor and WhisperForConditionalGeneration
+    - For Track A (CLIP): CLIPModel and CLIPProcessor
+    - For Track B (BLIP): BlipProcessor and BlipForConditionalGeneration
+    - For Track C (Whisper): WhisperProcessor and WhisperForConditionalGeneration
+
+    Models come from the shared registry in models.py, so the wrappers
+    (and repeated load_model calls) reuse one copy of the weights.
 
     Args:
         model_name (str): Hugging Face model identifier
+        torch_dtype (torch.dtype): Weight dtype, e.g. torch.float16
+            (default: checkpoint dtype)
 
     Returns:
         tuple: (model, processor)
     """
-    # TODO: Implement this function
-    raise NotImplementedError("TODO: Implement load_model()")
+    track = model_track(model_name)
+
+    if track == "clip":
+        wrapper = CLIPModel(model_name, torch_dtype=torch_dtype)
+        return wrapper.model, wrapper.processor
+    if track == "blip":
+        wrapper = BLIPModel(model_name, torch_dtype=torch_dtype)
+        return wrapper.model, wrapper.processor
+
+    asr = WhisperModel(model_name, torch_dtype=torch_dtype).asr
+    return asr.model, WhisperProcessor(feature_extractor=asr.feature_extractor, tokenizer=asr.tokenizer)
+
+
+def _checkpoint_revision(model_name, config):
+    """
+    Identify the exact weights of a checkpoint.
+
+    Hub checkpoints report their commit hash. For local directories the
+    names, sizes and modification times of the weight files stand in for
+    it, so re-saving a checkpoint changes the revision.
+    """
+    commit = getattr(config, "_commit_hash", None)
+    if commit:
+        return commit
+
+    path = Path(model_name)
+    if path.is_dir():
+        weights = sorted(p for p in path.iterdir() if p.suffix in (".safetensors", ".bin"))
+        return ";".join(f"{p.name}:{p.stat().st_size}:{p.stat().st_mtime_ns}" for p in weights)
+    return "unknown"
+
+
+@lru_cache(maxsize=None)
+def model_fingerprint(model_name):
+    """
+    Describe what decides a checkpoint's outputs, without loading weights.
+
+    Reads only the config, processor and generation config files, so the
+    output cache can be checked before (or instead of) loading the model.
+    Computed once per model per process.
+
+    Args:
+        model_name (str): Hugging Face model identifier or local path
+
+    Returns:
+        dict: "revision", "preprocess" (processor settings) and
+            "generation" (generation config)
+    """
+    config = AutoConfig.from_pretrained(model_name)
+    processor = AutoProcessor.from_pretrained(model_name)
+
+    preprocess = {}
+    for name in processor.attributes:
+        component = getattr(processor, name)
+        preprocess[name] = component.init_kwargs if name == "tokenizer" else component.to_dict()
+
+    try:
+        generation = GenerationConfig.from_pretrained(model_name)
+    except OSError:
+        generation = GenerationConfig.from_model_config(config)
 
+    return {
+        "revision": _checkpoint_revision(model_name, config),
+        "preprocess": preprocess,
+        "generation": generation.to_diff_dict(),
+    }
 
-def index_images(image_dir, model, processor):
+
+def output_cache_key(task, model_name, source, torch_dtype=None, **params):
+    """
+    Cache key for one model output (see utils.OutputCache).
+
+    The key covers the model id, revision, preprocessing and generation
+    config (model_fingerprint), the weight dtype, any extra parameters and
+    the hash of the input: file bytes for paths, the normalized text for
+    queries, the decoded pixels or samples otherwise. No model is needed,
+    so callers can check the cache before loading one.
+
+    Args:
+        task (str): "image_embedding", "text_embedding", "caption" or "transcript"
+        model_name (str): Hugging Face model identifier (model.name_or_path)
+        source (str | PIL.Image | np.ndarray): Input path, query text, or
+            decoded input
+        torch_dtype (torch.dtype): Weight dtype (default: torch's default dtype,
+            which is what load_model gives without a torch_dtype)
+        **params: Parameters that change the output (e.g. max_length)
+
+    Returns:
+        str: Hex key
+    """
+    if task == "text_embedding":
+        input_digest = content_digest(normalize_query(source))
+    else:
+        input_digest = file_digest(source) if isinstance(source, (str, Path)) else content_digest(source)
+
+    return OutputCache.cache_key(
+        task=task,
+        model=model_name,
+        fingerprint=model_fingerprint(model_name),
+        dtype=str(torch_dtype or torch.get_default_dtype()),
+        params=params,
+        input=input_digest,
+    )
+
+
+def index_images(image_dir, model, processor, batch_size=16, cache=None):
     """
     Index images and store embeddings (for CLIP retrieval).
 
-    TODO: Implement image indexing
-    - Load all images from image_dir
-    - Encode each image into embeddings
-    - Store embeddings in memory or file
-    - Return mapping of image paths to embeddings
+    Images are encoded `batch_size` at a time, one forward pass per batch.
+    With a cache, images whose embedding is already cached are neither
+    decoded nor encoded. Each stage is timed on utils.tracer (pipeline
+    "index_images").
 
     Args:
         image_dir (str): Directory containing images
         model: Loaded model
         processor: Loaded processor
+        batch_size (int): Images per forward pass
+        cache (OutputCache): On-disk cache of image embeddings (optional)
 
     Returns:
         dict: Mapping of image paths to embeddings
     """
-    # TODO: Implement this function
-    raise NotImplementedError("TODO: Implement index_images()")
+    image_paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    embeddings = {}
+    keys = {}
+
+    with trace_span("index_images", "total"):
+        if cache is not None:
+            with trace_span("index_images", "cache"):
+                for path in image_paths:
+                    keys[path] = output_cache_key("image_embedding", model.name_or_path, path, model.dtype)
+                    cached = cache.get(keys[path])
+                    if cached is not None:
+                        embeddings[str(path)] = cached
+            missing = [path for path in image_paths if str(path) not in embeddings]
+        else:
+            missing = image_paths
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+
+            with trace_span("index_images", "decode"):
+                images = [load_image(path) for path in batch]
+            with trace_span("index_images", "preprocess"):
+                inputs = processor(images=images, return_tensors="pt")
+            with trace_span("index_images", "copy"):
+                # Pixel values are cast to the weight dtype (e.g. float16)
+                inputs = inputs.to(model.device, model.dtype)
+
+            with torch.no_grad(), trace_span("index_images", "forward"):
+                image_features = model.get_image_features(**inputs)
+
+            with trace_span("index_images", "copy"):
+                image_features = image_features.float().cpu().numpy()
+            with trace_span("index_images", "postprocess"):
+                for path, features in zip(batch, image_features):
+                    embeddings[str(path)] = normalize_embedding(features)
+                    if cache is not None:
+                        cache.put(keys[path], embeddings[str(path)])
+
+    # Keep directory order whichever images came from the cache
+    return {str(path): embeddings[str(path)] for path in image_paths}
+
+
+def stack_embeddings(embeddings):
+    """
+    Stack index_images() output into one matrix for repeated searches.
+
+    Args:
+        embeddings (dict): Mapping of image paths to embeddings
+
+    Returns:
+        tuple: (embeddings matrix N x D, image paths), as load_embeddings()
+    """
+    image_paths = list(embeddings)
+    return np.stack([embeddings[path] for path in image_paths]), image_paths
 
 
-def search(query, embeddings, model, processor, top_k=5):
+def search(query, embeddings, model, processor, top_k=5, threshold=0.6, cache=None):
     """
     Search for images matching the query (for CLIP retrieval).
 
-    TODO: Implement search
-    - Encode query text into embedding
+    - Encode query text into embedding (stages timed on utils.tracer)
     - Compute similarity with all image embeddings
-    - Return top-k results with scores
-    - Implement fallback behavior for low-confidence results
+    - Select the top-k with a partial sort (np.argpartition), so the cost
+      of ranking stays O(N) even for large galleries
+    - Print a fallback message for low-confidence results
+
+    Pass embeddings as the (matrix, image_paths) pair from
+    stack_embeddings() or load_embeddings() when running many queries: a
+    dict is stacked into a matrix (an N x D copy) on every call.
 
     Args:
         query (str): Text query
-        embeddings (dict): Image embeddings from index_images()
+        embeddings (dict | tuple): Image embeddings from index_images(), or
+            (matrix, image_paths) from stack_embeddings()/load_embeddings()
         model: Loaded model
         processor: Loaded processor
         top_k (int): Number of results to return
+        threshold (float): Top-1 score below which the fallback is shown
+        cache (OutputCache): On-disk cache of query embeddings (optional);
+            scores are always recomputed, as the gallery may change
 
     Returns:
         list: Top-k results as (image_path, score) tuples
     """
-    # TODO: Implement this function
-    raise NotImplementedError("TODO: Implement search()")
+    with trace_span("search", "total"):
+        text_embedding = None
+        if cache is not None:
+            with trace_span("search", "cache"):
+                key = output_cache_key("text_embedding", model.name_or_path, query, model.dtype)
+                text_embedding = cache.get(key)
 
+        if text_embedding is None:
+            with trace_span("search", "preprocess"):
+                inputs = processor(text=[query], return_tensors="pt", padding=True)
+            with trace_span("search", "copy"):
+                inputs = inputs.to(model.device)
 
-def caption_image(image_path, model, processor):
+            with torch.no_grad(), trace_span("search", "forward"):
+                text_features = model.get_text_features(**inputs)
+
+            with trace_span("search", "copy"):
+                text_features = text_features[0].float().cpu().numpy()
+            text_embedding = normalize_embedding(text_features)
+            if cache is not None:
+                cache.put(key, text_embedding)
+
+        return rank_images(text_embedding, embeddings, top_k, threshold)
+
+
+def rank_images(text_embedding, embeddings, top_k=5, threshold=0.6):
+    """
+    Rank images against an already encoded query (the scoring half of search).
+
+    Args:
+        text_embedding (np.ndarray): Normalized query embedding
+        embeddings (dict | tuple): As for search()
+        top_k (int): Number of results to return
+        threshold (float): Top-1 score below which the fallback is shown
+
+    Returns:
+        list: Top-k results as (image_path, score) tuples
+    """
+    with trace_span("search", "score"):
+        image_embeddings, image_paths = stack_embeddings(embeddings) if isinstance(embeddings, dict) else embeddings
+        scores = image_embeddings @ text_embedding
+
+        results = [(image_paths[i], float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    if results and results[0][1] < threshold:
+        print(create_fallback_message(results, threshold))
+
+    return results
+
+
+def caption_image(image_path, model, processor, max_length=CAPTION_MAX_LENGTH, threshold=0.5, cache=None):
     """
     Generate caption for image (for BLIP captioning).
 
-    TODO: Implement image captioning
-    - Load image from image_path
-    - Generate caption using model
-    - Estimate confidence score
-    - Implement fallback for low-confidence captions
+    Confidence is the weaker of the caption's token confidence (from the
+    scores of the same generate() call) and the image quality score, as
+    in BLIPModel.generate_caption_with_confidence. Each stage is timed on
+    utils.tracer (pipeline "caption_image").
 
     Args:
-        image_path (str): Path to image file
+        image_path (str | PIL.Image): Path to image file, or an already
+            decoded RGB image
         model: Loaded model
         processor: Loaded processor
+        max_length (int): Maximum caption length
+        threshold (float): Confidence below which a fallback is printed
+        cache (OutputCache): On-disk cache of (caption, confidence) (optional)
 
     Returns:
         tuple: (caption, confidence_score)
     """
-    # TODO: Implement this function
-    raise NotImplementedError("TODO: Implement caption_image()")
-
-
-def transcribe_audio(audio_path, model, processor):
+    key = cached = None
+    if cache is not None:
+        with trace_span("caption_image", "cache"):
+            key = output_cache_key("caption", model.name_or_path, image_path, model.dtype, max_length=max_length)
+            cached = cache.get(key)
+
+    if cached is not None:
+        caption, confidence = cached
+    else:
+        caption, confidence = _caption(image_path, model, processor, max_length)
+        if cache is not None:
+            cache.put(key, [caption, confidence])
+
+    if confidence < threshold:
+        print(f"⚠️ Low confidence caption ({confidence:.2f} < {threshold}): \"{caption}\"")
+
+    return caption, confidence
+
+
+def _caption(image_path, model, processor, max_length):
+    """Run BLIP on one image; returns (caption, confidence)."""
+    with trace_span("caption_image", "total"):
+        with trace_span("caption_image", "decode"):
+            image = load_image(image_path) if isinstance(image_path, (str, Path)) else image_path
+        with trace_span("caption_image", "preprocess"):
+            inputs = processor(images=image, return_tensors="pt")
+        with trace_span("caption_image", "copy"):
+            inputs = inputs.to(model.device, model.dtype)
+
+        with torch.no_grad(), trace_span("caption_image", "forward"):
+            outputs = model.generate(
+                **inputs,
+                max_length=max_length,
+                output_scores=True,
+                return_dict_in_generate=True
+            )
+
+        with trace_span("caption_image", "postprocess"):
+            caption = processor.decode(outputs.sequences[0], skip_special_tokens=True)
+            token_confidence = sequence_confidences(model, outputs, model.config.text_config.sep_token_id)[0]
+            quality = image_quality_score(image)
+            confidence = min(token_confidence, quality)
+
+    return caption, confidence
+
+
+def transcribe_audio(audio_path, model, processor, threshold=0.5, cache=None):
     """
     Transcribe audio file (for Whisper transcription).
 
-    TODO: Implement audio transcription
-    - Load audio from audio_path
-    - Transcribe using model
-    - Calculate word error rate if ground truth available
-    - Implement fallback for low-quality audio
+    Audio longer than 30 s is cut into 30 s windows that are transcribed
+    as one batch (a word on a window boundary may be split). Confidence is
+    the mean token confidence of the windows. Each stage is timed on
+    utils.tracer (pipeline "transcribe_audio").
 
     Args:
-        audio_path (str): Path to audio file
+        audio_path (str | np.ndarray): Path to audio file, or an already
+            decoded 16 kHz mono waveform (utils.load_audio)
         model: Loaded model
         processor: Loaded processor
+        threshold (float): Confidence below which a fallback is printed
+        cache (OutputCache): On-disk cache of (transcript, confidence) (optional)
 
     Returns:
         tuple: (transcript, confidence_score)
     """
-    # TODO: Implement this function
-    raise NotImplementedError("TODO: Implement transcribe_audio()")
+    key = cached = None
+    if cache is not None:
+        with trace_span("transcribe_audio", "cache"):
+            key = output_cache_key("transcript", model.name_or_path, audio_path, model.dtype)
+            cached = cache.get(key)
+
+    if cached is not None:
+        transcript, confidence = cached
+    else:
+        transcript, confidence = _transcribe(audio_path, model, processor)
+        if cache is not None:
+            cache.put(key, [transcript, confidence])
+
+    if confidence < threshold:
+        print(f"⚠️ Low confidence transcript ({confidence:.2f} < {threshold}): \"{transcript}\"")
+
+    return transcript, confidence
+
+
+def _transcribe(audio_path, model, processor):
+    """Run Whisper on one recording; returns (transcript, confidence)."""
+    with trace_span("transcribe_audio", "total"):
+        with trace_span("transcribe_audio", "decode"):
+            audio = load_audio(audio_path, sr=SAMPLE_RATE) if isinstance(audio_path, (str, Path)) else audio_path
+
+        with trace_span("transcribe_audio", "preprocess"):
+            windows = [audio[i:i + WHISPER_WINDOW] for i in range(0, max(len(audio), 1), WHISPER_WINDOW)]
+            inputs = processor.feature_extractor(windows, sampling_rate=SAMPLE_RATE, return_tensors="pt")
+        with trace_span("transcribe_audio", "copy"):
+            input_features = inputs.input_features.to(model.device, model.dtype)
+
+        with torch.no_grad(), trace_span("transcribe_audio", "forward"):
+            outputs = model.generate(input_features, output_scores=True, return_dict_in_generate=True)
+
+        with trace_span("transcribe_audio", "postprocess"):
+            texts = processor.batch_decode(outputs.sequences, skip_special_tokens=True)
+            transcript = " ".join(text.strip() for text in texts).strip()
+            confidences = sequence_confidences(model, outputs, model.generation_config.eos_token_id)
+            confidence = float(np.mean(confidences))
+
+    return transcript, confidence
+
+
+def run_parallel(mode, model_name, inputs, num_workers=None):
+    """
+    Run index/caption/transcribe over many inputs on worker processes.
+
+    Each worker loads the model once and uses its share of the CPU cores
+    (see models.map_in_processes). Call from under
+    `if __name__ == "__main__":`.
+
+    Args:
+        mode (str): "index" (CLIP image embeddings), "caption" or "transcribe"
+        model_name (str): Hugging Face model identifier
+        inputs (list): Image or audio paths
+        num_workers (int): Worker processes (default: one per 4 cores)
+
+    Returns:
+        dict: Mapping of input path to embedding, caption or transcript
+    """
+    kind, method = {
+        "index": ("clip", "encode_image"),
+        "caption": ("blip", "generate_caption"),
+        "transcribe": ("whisper", "transcribe"),
+    }[mode]
+
+    inputs = [str(path) for path in inputs]
+    results = map_in_processes(kind, model_name, method, inputs, num_workers=num_workers)
+    return dict(zip(inputs, results))
 
 
 def main():
     """
     Main entry point for the pipeline.
 
-    TODO: Implement argument parsing and main logic
-    - Parse command-line arguments (mode, query, image_dir, etc.)
-    - Load model
-    - Run appropriate function based on mode
-    - Print results
+    --mode index encodes --image-dir and saves the embeddings to
+    --embeddings; --mode search loads them (or indexes --image-dir first
+    if they do not exist yet) and ranks the images for --query. caption
+    and transcribe run on a single --image / --audio file. Model outputs
+    are cached on disk under --cache-dir unless --no-cache is given (see
+    utils.OutputCache).
     """
     parser = argparse.ArgumentParser(description="W17D4 Multimodal Pipeline")
 
-    # TODO: Add arguments for your pipeline
-    # Examples:
-    # parser.add_argument("--mode", choices=["index", "search", "caption", "transcribe"])
-    # parser.add_argument("--model", default="openai/clip-vit-base-patch32")
-    # parser.add_argument("--query", type=str, help="Search query")
-    # parser.add_argument("--image-dir", type=str, help="Image directory")
-    # parser.add_argument("--image", type=str, help="Image path for captioning")
+    parser.add_argument("--mode", choices=list(DEFAULT_MODELS), required=True)
+    parser.add_argument("--model", help="Hugging Face model id (default depends on --mode)")
+    parser.add_argument("--query", type=str, help="Search query")
+    parser.add_argument("--image-dir", default=str(DEFAULT_IMAGE_DIR), help="Image directory")
+    parser.add_argument("--embeddings", default="embeddings.npy", help="Saved image embeddings (index/search)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--image", type=str, help="Image path for captioning")
+    parser.add_argument("--audio", type=str, help="Audio path for transcription")
+    parser.add_argument("--dtype", choices=["float32", "float16", "bfloat16"], help="Weight dtype")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help="On-disk cache of model outputs")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the model")
 
     args = parser.parse_args()
-
-    # TODO: Implement main logic
-    print("TODO: Implement main() function")
-
-    # Example structure:
-    # model, processor = load_model(args.model)
-    # if args.mode == "index":
-    #     embeddings = index_images(args.image_dir, model, processor)
-    # elif args.mode == "search":
-    #     results = search(args.query, embeddings, model, processor)
-    # ...
+    required = {"search": "query", "caption": "image", "transcribe": "audio"}.get(args.mode)
+    if required and not getattr(args, required):
+        parser.error(f"--mode {args.mode} requires --{required}")
+
+    torch_dtype = getattr(torch, args.dtype) if args.dtype else None
+    model, processor = load_model(args.model or DEFAULT_MODELS[args.mode], torch_dtype=torch_dtype)
+    cache = None if args.no_cache else OutputCache(args.cache_dir)
+
+    if args.mode == "index" or (args.mode == "search" and not Path(args.embeddings).exists()):
+        embeddings = index_images(args.image_dir, model, processor, cache=cache)
+        save_embeddings(*stack_embeddings(embeddings), args.embeddings)
+        print(f"Indexed {len(embeddings)} images from {args.image_dir} -> {args.embeddings}")
+
+    if args.mode == "search":
+        results = search(args.query, load_embeddings(args.embeddings), model, processor, top_k=args.top_k, cache=cache)
+        print(format_output(results, top_k=args.top_k))
+    elif args.mode == "caption":
+        caption, confidence = caption_image(args.image, model, processor, cache=cache)
+        print(f"Caption: {caption} (confidence {confidence:.2f})")
+    elif args.mode == "transcribe":
+        transcript, confidence = transcribe_audio(args.audio, model, processor, cache=cache)
+        print(f"Transcript: {transcript} (confidence {confidence:.2f})")
 
 
 if __name__ == "__main__":
@@ -2,62 +2,223 @@
 Model loading and inference wrapper for W17D4 Assignment
 """
 
+import gc
+import math
+import multiprocessing
+import os
+import threading
+
 import torch
 from PIL import Image
 import numpy as np
+from transformers import (
+    BlipForConditionalGeneration,
+    BlipProcessor,
+    CLIPModel as HFCLIPModel,
+    CLIPProcessor,
+    pipeline,
+)
+
+from utils import (
+    QueryEmbeddingCache,
+    image_quality_score,
+    load_image,
+    normalize_embedding,
+)
+
+
+# Process-wide model registry: one loaded instance per
+# (kind, model name, device, dtype), shared by every wrapper
+_MODELS = {}
+_MODELS_LOCK = threading.RLock()
+
+
+def default_device():
+    """Return "cuda" if a GPU is available, else "cpu"."""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _registry_key(kind, model_name, device, dtype):
+    return (kind, model_name, device or default_device(), str(dtype) if dtype is not None else None)
+
+
+def get_shared_model(kind, model_name, loader, device=None, dtype=None):
+    """
+    Return the shared model for a key, loading it on first use.
+
+    Args:
+        kind (str): Wrapper type, e.g. "clip", "blip" or "whisper"
+        model_name (str): Hugging Face model identifier
+        loader (callable): loader(model_name, device, dtype), called only
+            if the key is not loaded yet
+        device (str): Target device (default: cuda if available, else cpu)
+        dtype (torch.dtype): Weight dtype, or None for the checkpoint default
+
+    Returns:
+        object: Whatever the loader returned
+    """
+    key = _registry_key(kind, model_name, device, dtype)
+    with _MODELS_LOCK:
+        if key not in _MODELS:
+            _MODELS[key] = loader(model_name, key[2], dtype)
+        return _MODELS[key]
+
+
+def unload_model(kind, model_name, device=None, dtype=None):
+    """
+    Drop a model from the registry and free its memory.
+
+    Args:
+        kind (str): Wrapper type
+        model_name (str): Hugging Face model identifier
+        device (str): Device it was loaded on
+        dtype (torch.dtype): Weight dtype it was loaded with
+
+    Returns:
+        bool: True if the model was loaded
+    """
+    with _MODELS_LOCK:
+        model = _MODELS.pop(_registry_key(kind, model_name, device, dtype), None)
+
+    if model is None:
+        return False
+
+    del model
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return True
+
+
+def loaded_models():
+    """
+    List loaded models.
+
+    Returns:
+        list: Registry keys (kind, model_name, device, dtype)
+    """
+    with _MODELS_LOCK:
+        return list(_MODELS)
+
+
+def _load_clip(model_name, device, dtype):
+    model = HFCLIPModel.from_pretrained(model_name, torch_dtype=dtype)
+    processor = CLIPProcessor.from_pretrained(model_name)
+    model.to(device)
+    model.eval()
+    return model, processor
+
+
+def _load_blip(model_name, device, dtype):
+    processor = BlipProcessor.from_pretrained(model_name)
+    model = BlipForConditionalGeneration.from_pretrained(model_name, torch_dtype=dtype)
+    model.to(device)
+    model.eval()
+    return model, processor
+
+
+def _load_whisper(model_name, device, dtype):
+    return pipeline("automatic-speech-recognition", model=model_name, device=device, torch_dtype=dtype)
+
+
+def sequence_confidences(model, outputs, eos_token_id):
+    """
+    Token confidence of each generated sequence.
+
+    The geometric mean probability of a sequence's generated tokens (exp
+    of the mean log-probability), from the scores generate() returned
+    with output_scores=True, return_dict_in_generate=True. The end token
+    counts; padding after it does not.
+
+    Args:
+        model: Hugging Face generation model that produced `outputs`
+        outputs: generate() output with sequences and scores
+        eos_token_id (int): Token that ends a sequence
+
+    Returns:
+        list: One confidence (0-1) per sequence
+    """
+    logprobs = model.compute_transition_scores(outputs.sequences, outputs.scores, normalize_logits=True).float()
+    tokens = outputs.sequences[:, -logprobs.shape[1]:]
+
+    is_eos = tokens == eos_token_id
+    after_eos = (is_eos.cumsum(dim=1) - is_eos.int()) > 0
+    mask = (~after_eos).float()
+
+    mean_logprob = (logprobs * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+    return mean_logprob.exp().tolist()
 
 
 class CLIPModel:
     """
     Wrapper for CLIP model (Track A: Text-to-Image Retrieval).
-
-    TODO: Implement CLIP model wrapper
     """
 
-    def __init__(self, model_name="openai/clip-vit-base-patch32"):
+    def __init__(self, model_name="openai/clip-vit-base-patch32", text_cache=None,
+                 device=None, torch_dtype=None):
         """
         Initialize CLIP model.
 
-        TODO: Implement initialization
-        - Load CLIPModel and CLIPProcessor from transformers
-        - Set device (cuda if available, else cpu)
-        - Move model to device
+        The CLIPModel and CLIPProcessor are loaded lazily from the shared
+        model registry on first use, so wrappers with the same
+        (model, device, dtype) share one copy of the weights.
 
         Args:
             model_name (str): Hugging Face model identifier
+            text_cache (QueryEmbeddingCache): Cache for text embeddings
+                (a fresh 1024-entry cache by default)
+            device (str): Target device (default: cuda if available, else cpu)
+            torch_dtype (torch.dtype): Weight dtype (default: checkpoint dtype)
+        """
+        self.model_name = model_name
+        self.device = device or default_device()
+        self.torch_dtype = torch_dtype
+
+        self.text_cache = text_cache if text_cache is not None else QueryEmbeddingCache()
+
+    @property
+    def model(self):
+        return get_shared_model("clip", self.model_name, _load_clip, self.device, self.torch_dtype)[0]
+
+    @property
+    def processor(self):
+        return get_shared_model("clip", self.model_name, _load_clip, self.device, self.torch_dtype)[1]
+
+    def unload(self):
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement CLIPModel.__init__()")
+        Release the shared model (it is reloaded on next use).
+
+        Returns:
+            bool: True if the model was loaded
+        """
+        return unload_model("clip", self.model_name, self.device, self.torch_dtype)
 
     def encode_image(self, image_path):
         """
         Encode image into embedding.
 
-        TODO: Implement image encoding
-        - Load image from path
-        - Preprocess with processor
-        - Get image features from model
-        - Normalize embedding
-        - Return embedding as numpy array
-
         Args:
             image_path (str): Path to image file
 
         Returns:
             np.ndarray: Image embedding (normalized)
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement encode_image()")
+        image = load_image(image_path)
+        model = self.model
+        # Pixel values are cast to the weight dtype (e.g. float16)
+        inputs = self.processor(images=image, return_tensors="pt").to(self.device, model.dtype)
+
+        with torch.no_grad():
+            image_features = model.get_image_features(**inputs)
+
+        return normalize_embedding(image_features[0].float().cpu().numpy())
 
     def encode_text(self, text):
         """
         Encode text into embedding.
 
-        TODO: Implement text encoding
-        - Preprocess text with processor
-        - Get text features from model
-        - Normalize embedding
-        - Return embedding as numpy array
+        Repeated queries are served from the text cache, skipping the
+        tokenizer and text encoder entirely.
 
         Args:
             text (str): Text query
@@ -65,17 +226,23 @@ class CLIPModel:
         Returns:
             np.ndarray: Text embedding (normalized)
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement encode_text()")
+        embedding = self.text_cache.get(self.model_name, text)
+        if embedding is not None:
+            return embedding
+
+        inputs = self.processor(text=[text], return_tensors="pt", padding=True).to(self.device)
+
+        with torch.no_grad():
+            text_features = self.model.get_text_features(**inputs)
+
+        embedding = normalize_embedding(text_features[0].float().cpu().numpy())
+        self.text_cache.put(self.model_name, text, embedding)
+        return embedding
 
     def compute_similarity(self, text_embedding, image_embeddings):
         """
         Compute similarity between text and images.
 
-        TODO: Implement similarity computation
-        - Compute dot product between text and image embeddings
-        - Return similarity scores
-
         Args:
             text_embedding (np.ndarray): Text embedding
             image_embeddings (np.ndarray): Image embeddings (N x D)
@@ -83,17 +250,12 @@ class CLIPModel:
         Returns:
             np.ndarray: Similarity scores (N,)
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement compute_similarity()")
+        return np.asarray(image_embeddings) @ text_embedding
 
     def fallback_check(self, similarity_scores, threshold=0.6):
         """
         Check if fallback should be triggered.
 
-        TODO: Implement fallback logic
-        - Check if top-1 score is below threshold
-        - Return boolean indicating if fallback needed
-
         Args:
             similarity_scores (np.ndarray): Similarity scores
             threshold (float): Confidence threshold
@@ -101,43 +263,53 @@ class CLIPModel:
         Returns:
             bool: True if fallback should trigger, False otherwise
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement fallback_check()")
+        if len(similarity_scores) == 0:
+            return True
+        return bool(np.max(similarity_scores) < threshold)
 
 
 class BLIPModel:
     """
     Wrapper for BLIP model (Track B: Image Captioning).
-
-    TODO: Implement BLIP model wrapper
     """
 
-    def __init__(self, model_name="Salesforce/blip-image-captioning-base"):
+    def __init__(self, model_name="Salesforce/blip-image-captioning-base", device=None, torch_dtype=None):
         """
         Initialize BLIP model.
 
-        TODO: Implement initialization
-        - Load BlipProcessor and BlipForConditionalGeneration
-        - Set device
-        - Move model to device
+        BlipProcessor and BlipForConditionalGeneration are loaded lazily
+        from the shared model registry on first use.
 
         Args:
             model_name (str): Hugging Face model identifier
+            device (str): Target device (default: cuda if available, else cpu)
+            torch_dtype (torch.dtype): Weight dtype (default: checkpoint dtype)
+        """
+        self.model_name = model_name
+        self.device = device or default_device()
+        self.torch_dtype = torch_dtype
+
+    @property
+    def model(self):
+        return get_shared_model("blip", self.model_name, _load_blip, self.device, self.torch_dtype)[0]
+
+    @property
+    def processor(self):
+        return get_shared_model("blip", self.model_name, _load_blip, self.device, self.torch_dtype)[1]
+
+    def unload(self):
+        """
+        Release the shared model (it is reloaded on next use).
+
+        Returns:
+            bool: True if the model was loaded
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement BLIPModel.__init__()")
+        return unload_model("blip", self.model_name, self.device, self.torch_dtype)
 
     def generate_caption(self, image_path, max_length=50):
         """
         Generate caption for image.
 
-        TODO: Implement caption generation
-        - Load image from path
-        - Preprocess with processor
-        - Generate caption with model
-        - Decode output tokens to text
-        - Return caption string
-
         Args:
             image_path (str): Path to image file
             max_length (int): Maximum caption length
@@ -145,17 +317,59 @@ class BLIPModel:
         Returns:
             str: Generated caption
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement generate_caption()")
+        image = load_image(image_path)
+        inputs = self.processor(images=image, return_tensors="pt").to(self.device, self.model.dtype)
+
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, max_length=max_length)
+
+        return self.processor.decode(outputs[0], skip_special_tokens=True)
+
+    def generate_caption_with_confidence(self, image_path, max_length=50):
+        """
+        Generate a caption and its confidence from one generate() call.
+
+        Confidence combines two signals and takes the weaker one:
+        - token confidence: geometric mean probability of the generated
+          tokens (exp of the mean log-probability), from the scores the
+          same generate() call returns
+        - image quality: utils.image_quality_score on the decoded image
+
+        Args:
+            image_path (str): Path to image file
+            max_length (int): Maximum caption length
+
+        Returns:
+            tuple: (caption, confidence score 0-1)
+        """
+        image = load_image(image_path)
+        inputs = self.processor(images=image, return_tensors="pt").to(self.device, self.model.dtype)
+
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_length=max_length,
+                output_scores=True,
+                return_dict_in_generate=True
+            )
+
+        caption = self.processor.decode(outputs.sequences[0], skip_special_tokens=True)
+
+        # BLIP's generate() ends captions with the text decoder's [SEP] token
+        token_confidence = sequence_confidences(
+            self.model, outputs, self.model.config.text_config.sep_token_id
+        )[0]
+
+        quality = image_quality_score(image)
+
+        return caption, min(token_confidence, quality)
 
     def estimate_confidence(self, image_path):
         """
         Estimate confidence of caption.
 
-        TODO: Implement confidence estimation
-        - Simple heuristic: check image brightness/quality
-        - Or: use generation log probabilities
-        - Return confidence score (0-1)
+        Runs generate_caption_with_confidence; when you also need the
+        caption, call that directly instead so the model only runs once.
 
         Args:
             image_path (str): Path to image file
@@ -163,26 +377,55 @@ class BLIPModel:
         Returns:
             float: Confidence score (0-1)
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement estimate_confidence()")
+        return self.generate_caption_with_confidence(image_path)[1]
+
+    def fallback_check(self, confidence, threshold=0.5):
+        """
+        Check if fallback should be triggered.
+
+        Args:
+            confidence (float): Caption confidence (0-1)
+            threshold (float): Confidence threshold
+
+        Returns:
+            bool: True if fallback should trigger, False otherwise
+        """
+        return bool(confidence < threshold)
 
 
 class WhisperModel:
     """
     Wrapper for Whisper model (Track C: Audio Transcription).
-
-    TODO: Implement Whisper model wrapper (optional)
     """
 
-    def __init__(self, model_name="openai/whisper-base"):
+    def __init__(self, model_name="openai/whisper-base", device=None, torch_dtype=None):
         """
         Initialize Whisper model.
 
+        The ASR pipeline is loaded lazily from the shared model registry
+        on first use.
+
         Args:
             model_name (str): Hugging Face model identifier
+            device (str): Target device (default: cuda if available, else cpu)
+            torch_dtype (torch.dtype): Weight dtype (default: checkpoint dtype)
+        """
+        self.model_name = model_name
+        self.device = device or default_device()
+        self.torch_dtype = torch_dtype
+
+    @property
+    def asr(self):
+        return get_shared_model("whisper", self.model_name, _load_whisper, self.device, self.torch_dtype)
+
+    def unload(self):
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement WhisperModel.__init__()")
+        Release the shared pipeline (it is reloaded on next use).
+
+        Returns:
+            bool: True if the pipeline was loaded
+        """
+        return unload_model("whisper", self.model_name, self.device, self.torch_dtype)
 
     def transcribe(self, audio_path):
         """
@@ -194,5 +437,86 @@ class WhisperModel:
         Returns:
             str: Transcription
         """
-        # TODO: Implement this method
-        raise NotImplementedError("TODO: Implement transcribe()")
+        import librosa  # Optional dependency (Whisper track only)
+
+        audio, _ = librosa.load(audio_path, sr=16000)
+        return self.asr(audio, return_timestamps=True)["text"]
+
+    def fallback_check(self, confidence, threshold=0.5):
+        """
+        Check if fallback should be triggered.
+
+        Args:
+            confidence (float): Transcript confidence (0-1)
+            threshold (float): Confidence threshold
+
+        Returns:
+            bool: True if fallback should trigger, False otherwise
+        """
+        return bool(confidence < threshold)
+
+
+# Process-pool execution: each worker process builds one wrapper and loads
+# its model once (pool initializer), then handles chunks of inputs
+_WRAPPERS = {"clip": CLIPModel, "blip": BLIPModel, "whisper": WhisperModel}
+_worker_model = None
+_worker_error = None
+
+
+def _init_pool_worker(kind, model_name, threads):
+    global _worker_model, _worker_error
+    torch.set_num_threads(threads)
+    # A failing initializer makes Pool respawn workers forever, so keep the
+    # error and raise it from the first task instead
+    try:
+        _worker_model = _WRAPPERS[kind](model_name)
+        getattr(_worker_model, "asr" if kind == "whisper" else "model")  # warm start
+    except Exception as e:
+        _worker_error = e
+
+
+def _run_pool_chunk(task):
+    if _worker_error is not None:
+        raise RuntimeError(f"Worker failed to start: {_worker_error!r}")
+    method, chunk = task
+    return [getattr(_worker_model, method)(item) for item in chunk]
+
+
+def map_in_processes(kind, model_name, method, items, num_workers=None, chunksize=None):
+    """
+    Run a wrapper method over many inputs on a pool of worker processes.
+
+    Each worker loads its own copy of the model once and limits torch to
+    its share of the CPU cores, so N workers keep N groups of cores busy
+    instead of one process underusing them all. Scripts calling this need
+    an `if __name__ == "__main__":` guard (workers are spawned).
+
+    Args:
+        kind (str): "clip", "blip" or "whisper"
+        model_name (str): Hugging Face model identifier
+        method (str): Wrapper method taking one input, e.g. "encode_image",
+            "generate_caption" or "transcribe"
+        items (list): Inputs (image or audio paths)
+        num_workers (int): Worker processes (default: one per 4 cores)
+        chunksize (int): Inputs per task (default: ~4 tasks per worker)
+
+    Returns:
+        list: One result per input, in input order
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    num_workers = num_workers or max(1, cores // 4)
+    threads = max(1, cores // num_workers)
+    chunksize = chunksize or math.ceil(len(items) / (num_workers * 4))
+    tasks = [(method, items[i:i + chunksize]) for i in range(0, len(items), chunksize)]
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(num_workers, initializer=_init_pool_worker,
+                      initargs=(kind, model_name, threads)) as pool:
+        results = []
+        for chunk_results in pool.imap(_run_pool_chunk, tasks):
+            results.extend(chunk_results)
+    return results
@@ -5,53 +5,271 @@ Reads TEST_PLAN.md, executes tests, and writes results to RESULTS.md
 """
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import partial
+import os
 from pathlib import Path
 import re
+import threading
 
+import numpy as np
+import torch
 
-def parse_test_plan(test_plan_path):
+from main import (
+    CAPTION_MAX_LENGTH,
+    IMAGE_EXTENSIONS,
+    caption_image,
+    index_images,
+    load_model,
+    model_track,
+    output_cache_key,
+    rank_images,
+    search,
+    stack_embeddings,
+    transcribe_audio,
+)
+from models import BLIPModel, CLIPModel, WhisperModel, loaded_models
+from utils import DEFAULT_CACHE_DIR, OutputCache, load_audio, load_image, tracer
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+# File names mentioned in a test case's input description
+INPUT_FILE = re.compile(r"[\w./-]+\.(?:jpe?g|png|bmp|webp|wav|mp3|flac|ogg|m4a)\b", re.IGNORECASE)
+
+# Expected behaviors containing these ask for a fallback rather than an answer
+FALLBACK_WORDS = ("fallback", "refuse", "low confidence")
+
+# Wrappers whose fallback_check decides whether a result is low confidence
+FALLBACK_CHECKS = {"clip": CLIPModel, "blip": BLIPModel, "whisper": WhisperModel}
+
+FEATURES = {"clip": "CLIP Retrieval", "blip": "Image Captioning", "whisper": "Audio Transcription"}
+
+
+def _filled(value):
+    """Return a template field's value, or None if it is still a [placeholder]."""
+    value = (value or "").strip()
+    if not value or (value.startswith("[") and value.endswith("]")):
+        return None
+    return value
+
+
+def _resolve_input(name, data_dir):
+    """Find an input file by name: as given, then under data_dir."""
+    candidates = [Path(name), data_dir / name, data_dir / "images" / name, data_dir / "audio" / name]
+    for candidate in candidates:
+        if candidate.is_file():
+            return str(candidate)
+    matches = sorted(data_dir.rglob(Path(name).name)) if data_dir.is_dir() else []
+    return str(matches[0]) if matches else None
+
+
+def parse_test_plan(test_plan_path, data_dir=DEFAULT_DATA_DIR):
     """
     Parse TEST_PLAN.md and extract test cases.
 
-    TODO: Implement test plan parsing
-    - Read TEST_PLAN.md file
-    - Parse the evidence table
-    - Extract test case IDs, inputs, and expected behaviors
-    - Return list of test case dictionaries
+    Rows come from the evidence table (the table whose header has a
+    test_case_id column). The "Detailed Test Cases" section adds each
+    case's query, and its input file when the table does not name one.
+    Input files are file names such as dog_clear.jpg, looked up as given
+    and then under data_dir (and its images/ and audio/ folders).
 
     Args:
         test_plan_path (str): Path to TEST_PLAN.md
+        data_dir (str): Directory holding the test inputs
 
     Returns:
         list: List of test case dictionaries with keys:
               - test_case_id
               - input_description
               - expected_behavior
+              - query (None if the plan gives none)
+              - input_path (None if no input file was found)
+    """
+    lines = Path(test_plan_path).read_text(encoding="utf-8").splitlines()
+    data_dir = Path(data_dir)
+
+    # Evidence table
+    rows = []
+    header = None
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("|"):
+            if header is not None and rows:
+                break
+            continue
+
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        if header is None:
+            if "test_case_id" in cells:
+                header = cells
+        elif not set("".join(cells)) <= set("-: "):
+            rows.append(dict(zip(header, cells)))
+
+    # Detailed test cases: "#### Test Case: id" followed by "- **Field:** value"
+    details = {}
+    current = None
+    for line in lines:
+        heading = re.match(r"#+\s*Test Case:\s*(\S+)", line)
+        if heading:
+            current = details.setdefault(heading.group(1), {})
+            continue
+        field = re.match(r"\s*-\s*\*\*(.+?):\*\*\s*(.*)", line)
+        if current is not None and field:
+            key = re.sub(r"\s*\(.*\)", "", field.group(1)).strip().lower()
+            current[key] = field.group(2)
+
+    test_cases = []
+    for row in rows:
+        test_case_id = row.get("test_case_id", "")
+        if not _filled(test_case_id):
+            continue
+
+        detail = details.get(test_case_id, {})
+        input_description = row.get("input_description", "")
+        match = INPUT_FILE.search(input_description) or INPUT_FILE.search(detail.get("input", ""))
+
+        test_cases.append({
+            "test_case_id": test_case_id,
+            "input_description": input_description,
+            "expected_behavior": _filled(row.get("expected_behavior")) or _filled(detail.get("expected behavior")) or "",
+            "query": (_filled(detail.get("query")) or "").strip('"') or None,
+            "input_path": _resolve_input(match.group(0), data_dir) if match else None,
+        })
+
+    return test_cases
+
+
+def _input_mismatch(track, input_path):
+    """Why an input file cannot go to this track's model, or None if it can."""
+    if track == "clip" or input_path is None:
+        return None
+    is_image = Path(input_path).suffix.lower() in IMAGE_EXTENSIONS
+    if track == "whisper" and is_image:
+        return "expected audio input for whisper"
+    if track == "blip" and not is_image:
+        return "expected image input for blip"
+    return None
+
+
+def _work_key(track, test_case):
     """
-    # TODO: Implement this function
-    # Hint: Look for the evidence table in the markdown file
-    # Hint: Use regex or simple string parsing to extract rows
+    What the model runs on for a case: its query (CLIP) or its input file.
+
+    None when there is nothing to run, including an input of the wrong
+    type for the track (see _input_mismatch).
+    """
+    if track == "clip":
+        return test_case.get("query")
+    input_path = test_case.get("input_path")
+    return None if _input_mismatch(track, input_path) else input_path
+
 
-    raise NotImplementedError("TODO: Implement parse_test_plan()")
+def _attempt(fn, *args):
+    """Call fn(*args), returning the exception instead of raising it."""
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
 
 
-def run_test_case(test_case, model, processor, embeddings=None):
+class LazyModel:
+    """
+    Load a model through main.load_model (and so the models.py registry)
+    on first use only.
+
+    Calling the instance returns (model, processor). Threads calling it
+    together load the model once.
+    """
+
+    def __init__(self, model_name, torch_dtype=None):
+        self.model_name = model_name
+        self.torch_dtype = torch_dtype
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self._loaded is None:
+                self._loaded = load_model(self.model_name, torch_dtype=self.torch_dtype)
+            return self._loaded
+
+
+def _output_cache_key(track, key, model_name, torch_dtype=None):
+    """Cache key of a case's output, as search/caption_image/transcribe_audio compute it."""
+    if track == "clip":
+        return output_cache_key("text_embedding", model_name, key, torch_dtype)
+    if track == "blip":
+        return output_cache_key("caption", model_name, key, torch_dtype, max_length=CAPTION_MAX_LENGTH)
+    return output_cache_key("transcript", model_name, key, torch_dtype)
+
+
+def index_gallery(image_dir, model, cache=None):
+    """
+    Embed the images of image_dir for CLIP search, loading the model only
+    if an embedding is missing from the cache.
+
+    Args:
+        image_dir (str): Directory of images
+        model (LazyModel): Model to index with
+        cache (OutputCache): On-disk cache of image embeddings (optional)
+
+    Returns:
+        tuple: (embeddings matrix N x D, image paths), as main.stack_embeddings
+    """
+    if cache is not None:
+        image_paths = [str(p) for p in sorted(Path(image_dir).iterdir()) if p.suffix.lower() in IMAGE_EXTENSIONS]
+        keys = [output_cache_key("image_embedding", model.model_name, path, model.torch_dtype) for path in image_paths]
+        # On a miss index_images does the lookups, so each counts once
+        if image_paths and all(key in cache for key in keys):
+            cached = [cache.get(key) for key in keys]
+            if all(embedding is not None for embedding in cached):
+                return np.stack(cached), image_paths
+
+    return stack_embeddings(index_images(image_dir, *model(), cache=cache))
+
+
+def _run_model(track, key, model, processor, embeddings=None, decoded=None, cache=None):
+    """
+    Run the model on one query (CLIP) or input file.
+
+    Returns:
+        list of (image_path, score) tuples for CLIP, (text, confidence) otherwise
+    """
+    if track == "clip":
+        return search(key, embeddings, model, processor, top_k=3, cache=cache)
+
+    source = key if decoded is None else decoded
+    if track == "blip":
+        return caption_image(source, model, processor, cache=cache)
+    return transcribe_audio(source, model, processor, cache=cache)
+
+
+def run_test_case(test_case, model, processor, embeddings=None, output=None):
     """
     Execute a single test case.
 
-    TODO: Implement test case execution
-    - Based on test_case_id, determine test type (normal, vision_stress, uncertain)
-    - Load appropriate input (image, audio, or text query)
-    - Run pipeline on input
-    - Capture actual output
-    - Determine pass/fail based on expected_behavior
-    - Return test result dictionary
+    The track comes from the model (CLIP, BLIP or Whisper):
+    - CLIP: search the indexed images for the case's query
+    - BLIP: caption the case's input image
+    - Whisper: transcribe the case's input audio
+
+    The wrapper's fallback_check decides whether the result is low
+    confidence. A case whose expected behavior asks for a fallback
+    ("fallback", "refuse", "low confidence") passes when one triggers.
+    Any other case passes when no fallback triggers and the output is
+    right: for CLIP the top-1 image is the case's input image, otherwise
+    the output contains one of the "quoted" terms of the expected
+    behavior (if it has any).
 
     Args:
         test_case (dict): Test case from parse_test_plan()
         model: Loaded model
         processor: Loaded processor
-        embeddings (dict): Image embeddings (for CLIP retrieval)
+        embeddings (tuple): (matrix, image_paths) from main.stack_embeddings
+            (for CLIP retrieval)
+        output: Model output for this case, already computed by
+            run_test_cases (or the exception it raised); None runs the model
 
     Returns:
         dict: Test result with keys:
@@ -59,86 +277,360 @@ def run_test_case(test_case, model, processor, embeddings=None):
               - input_description
               - expected_behavior
               - actual_output
-              - pass_fail (True/False or "PASS"/"FAIL")
+              - pass_fail ("PASS"/"FAIL")
               - notes_next_step
     """
-    # TODO: Implement this function
+    track = model.config.model_type
+    key = _work_key(track, test_case)
+    if output is None and key:
+        output = _attempt(_run_model, track, key, model, processor, embeddings)
+    return evaluate_output(test_case, track, model.name_or_path, output)
+
+
+def evaluate_output(test_case, track, model_name, output):
+    """
+    Decide pass/fail for a test case from its model output (see run_test_case).
+
+    Needs no loaded model, so cached outputs are judged without one.
 
-    raise NotImplementedError("TODO: Implement run_test_case()")
+    Args:
+        test_case (dict): Test case from parse_test_plan()
+        track (str): "clip", "blip" or "whisper"
+        model_name (str): Model identifier, for the wrapper's fallback_check
+        output: Model output for this case, or the exception it raised
+
+    Returns:
+        dict: Test result (see run_test_case)
+    """
+    checker = FALLBACK_CHECKS[track](model_name)
+
+    expected = test_case["expected_behavior"]
+    expect_fallback = any(word in expected.lower() for word in FALLBACK_WORDS)
+    terms = [term.lower() for term in re.findall(r'"([^"]+)"', expected)]
+    input_path = test_case.get("input_path")
+
+    result = {
+        "test_case_id": test_case["test_case_id"],
+        "input_description": test_case["input_description"],
+        "expected_behavior": expected,
+    }
+
+    if track == "clip" and not test_case.get("query"):
+        return dict(result, actual_output="No query in test plan", pass_fail="FAIL",
+                    notes_next_step="Add a **Query:** line to this test case")
+    if track != "clip" and input_path is None:
+        return dict(result, actual_output="Input file not found", pass_fail="FAIL",
+                    notes_next_step="Name the input file in input_description and add it to data/")
+    mismatch = _input_mismatch(track, input_path)
+    if mismatch:
+        return dict(result, actual_output=f"Wrong input type: {mismatch}, got {Path(input_path).name}",
+                    pass_fail="FAIL", notes_next_step="Move this case to the test plan of the matching track")
+
+    if isinstance(output, Exception):
+        # Some errors (e.g. librosa decoding an image) carry no message
+        error = f"{type(output).__name__}: {output}" if str(output) else type(output).__name__
+        return dict(result, actual_output=f"Error: {error}", pass_fail="FAIL",
+                    notes_next_step="Fix the error and rerun")
+
+    if track == "clip":
+        fallback = checker.fallback_check(np.array([score for _, score in output]))
+        actual = "; ".join(f"{Path(path).name} ({score:.2f})" for path, score in output)
+        top_1 = Path(output[0][0]).name.lower() if output else ""
+        if input_path is not None:
+            correct = top_1 == Path(input_path).name.lower()
+        else:
+            correct = not terms or any(term in top_1 for term in terms)
+    else:
+        text, confidence = output
+        fallback = checker.fallback_check(confidence)
+        actual = f'"{text}" (confidence {confidence:.2f})'
+        correct = not terms or any(term in text.lower() for term in terms)
+
+    if fallback:
+        actual += " [fallback]"
+
+    if expect_fallback:
+        passed = fallback
+        notes = "" if passed else "Confident output where a fallback was expected: raise the fallback threshold"
+    else:
+        passed = not fallback and correct
+        if passed:
+            notes = ""
+        elif fallback:
+            notes = "Fallback on an input expected to work: check the threshold and input quality"
+        else:
+            notes = "Wrong output: add targeted tests for this input type"
+
+    return dict(result, actual_output=actual, pass_fail="PASS" if passed else "FAIL", notes_next_step=notes)
+
+
+def run_test_cases(test_cases, model, embeddings=None, num_workers=4, cache=None):
+    """
+    Execute all test cases, sharing work between them.
+
+    - Cases with the same query (CLIP) or input file run the model once.
+    - With a cache, outputs already cached for the same model, config
+      and input bytes (query embeddings for CLIP) are reused: no decoding,
+      no inference, and the model is not even loaded if every case hits.
+      Pass/fail is still decided here from the output (fallback_check),
+      so changing thresholds does not need new model outputs.
+    - Every distinct input file that still needs the model is decoded
+      once, up front, on `num_workers` threads (decoded inputs are held
+      in memory); new outputs are then added to the cache.
+    - Model calls run on `num_workers` threads sharing the one loaded
+      model. The first call runs alone, so loading and lazy setup
+      (processor, tokenizer padding state) finish before threads share
+      the model.
+
+    Results come back in test plan order, whatever order the calls finish.
 
+    Args:
+        test_cases (list): Test cases from parse_test_plan()
+        model (LazyModel): Model to run, loaded on the first cache miss
+        embeddings (tuple): (matrix, image_paths) from index_gallery
+            (for CLIP retrieval)
+        num_workers (int): Threads for decoding and model calls
+        cache (OutputCache): On-disk cache of model outputs (optional)
 
-def write_results(results, output_path):
+    Returns:
+        list: Test result dictionaries (see run_test_case), in order
+    """
+    track = model_track(model.model_name)
+    keys = [_work_key(track, test_case) for test_case in test_cases]
+    unique = list(dict.fromkeys(key for key in keys if key))
+    num_workers = max(1, num_workers)
+
+    # Outputs are looked up by query or input file before anything is
+    # decoded or loaded
+    outputs = {}
+    cache_keys = {}
+    if cache is not None:
+        for key in unique:
+            cache_key = _attempt(_output_cache_key, track, key, model.model_name, model.torch_dtype)
+            if isinstance(cache_key, Exception):
+                continue  # Unreadable input: decoding reports the error
+            cache_keys[key] = cache_key
+            if track == "clip" and cache_key not in cache:
+                continue  # search() looks the query up again, counting the miss once
+            cached = cache.get(cache_key)
+            if cached is None:
+                continue
+            outputs[key] = rank_images(cached, embeddings, top_k=3) if track == "clip" else tuple(cached)
+    pending = [key for key in unique if key not in outputs]
+
+    decoded = {}
+    if track != "clip":
+        decode = load_audio if track == "whisper" else load_image
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            decoded = dict(zip(pending, pool.map(partial(_attempt, decode), pending)))
+
+    def work(key):
+        if isinstance(decoded.get(key), Exception):
+            return decoded[key]
+        loaded = _attempt(model)
+        if isinstance(loaded, Exception):
+            return loaded
+        if track == "clip":
+            # search() adds the query embedding to the cache itself
+            return _attempt(_run_model, track, key, *loaded, embeddings, None, cache)
+        output = _attempt(_run_model, track, key, *loaded, embeddings, decoded.pop(key))
+        if key in cache_keys and not isinstance(output, Exception):
+            cache.put(cache_keys[key], list(output))
+        return output
+
+    if pending:
+        outputs[pending[0]] = work(pending[0])
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        outputs.update(zip(pending[1:], pool.map(work, pending[1:])))
+
+    return [
+        evaluate_output(test_case, track, model.model_name, outputs.get(key))
+        for test_case, key in zip(test_cases, keys)
+    ]
+
+
+def _cell(value):
+    """Make a value safe for a markdown table cell."""
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def write_results(results, output_path, feature="", trace=None):
     """
     Write test results to RESULTS.md.
 
-    TODO: Implement results writing
-    - Create RESULTS.md with proper formatting
-    - Include summary statistics (X/Y passed)
-    - Write filled evidence table with actual outputs
-    - Categorize failures by type (blur, low-light, etc.)
-    - Include representative failure examples
+    Follows templates/RESULTS.md.template: summary statistics, the filled
+    evidence table, failures by category, and (with `trace`) the latency
+    of every pipeline stage.
 
     Args:
         results (list): List of test result dictionaries
         output_path (str): Path to RESULTS.md
+        feature (str): Feature name for the title
+        trace (dict): utils.tracer.to_dict() output, or None
     """
-    # TODO: Implement this function
-    # Hint: Use the RESULTS.md.template as a guide
-
-    raise NotImplementedError("TODO: Implement write_results()")
+    total = len(results)
+    passed = sum(result["pass_fail"] == "PASS" for result in results)
+    pass_rate = passed / total if total else 0.0
+
+    lines = [
+        f"# Test Results - {feature}",
+        "",
+        f"**Feature:** {feature}",
+        "",
+        f"**Test Date:** {date.today().isoformat()}",
+        "",
+        "---",
+        "",
+        "## Summary Statistics",
+        "",
+        f"**Total Tests:** {total}",
+        f"**Passed:** {passed} ✅",
+        f"**Failed:** {total - passed} ❌",
+        f"**Pass Rate:** {pass_rate:.0%}",
+        "",
+        "---",
+        "",
+        "## Evidence Table (FILLED)",
+        "",
+        "| test_case_id | input_description | expected_behavior | actual_output | pass_fail | notes_next_step |",
+        "|--------------|-------------------|-------------------|---------------|-----------|-----------------|",
+    ]
+    for result in results:
+        mark = "✅" if result["pass_fail"] == "PASS" else "❌"
+        lines.append(
+            f"| {_cell(result['test_case_id'])} | {_cell(result['input_description'])} "
+            f"| {_cell(result['expected_behavior'])} | **{_cell(result['actual_output'])}** "
+            f"| {mark} | {_cell(result['notes_next_step'])} |"
+        )
+
+    lines += ["", "---", "", "## Detailed Failure Analysis", ""]
+    failures = categorize_failures(results)
+    if not failures:
+        lines.append("No failures.")
+    for category, failed in failures.items():
+        lines += [
+            f"### Failure Category: {category.title()}",
+            "",
+            f"**Failed Tests:** {', '.join(result['test_case_id'] for result in failed)}",
+            "",
+            "**Example Output:**",
+            "```",
+            f"Input: {failed[0]['input_description']}",
+            f"Expected: {failed[0]['expected_behavior']}",
+            f"Actual: {failed[0]['actual_output']}",
+            "```",
+            "",
+        ]
+
+    if trace:
+        lines += [
+            "---",
+            "",
+            "## Latency by Stage",
+            "",
+            "| pipeline | stage | calls | p50 ms | p95 ms | p99 ms | mean ms | total ms |",
+            "|----------|-------|-------|--------|--------|--------|---------|----------|",
+        ]
+        for pipeline, stages in trace.items():
+            for stage, stats in stages.items():
+                lines.append(
+                    f"| {pipeline} | {stage} | {stats['count']} | {stats['p50_ms']:.2f} | {stats['p95_ms']:.2f} "
+                    f"| {stats['p99_ms']:.2f} | {stats['mean_ms']:.2f} | {stats['total_ms']:.1f} |"
+                )
+
+    Path(output_path).write_text("\n".join(lines) + "\n", encoding="utf-8")
 
 
 def categorize_failures(results):
     """
     Categorize failures by type.
 
-    TODO: Implement failure categorization
-    - Group failures by category (blur, low-light, clutter, etc.)
-    - Count failures per category
-    - Return categorized failure dictionary
+    The category comes from the test case id: vision_<type>_NN gives
+    <type> (blur, lowlight, clutter, ...), otherwise the id's prefix
+    (normal, uncertain, ...).
 
     Args:
         results (list): List of test result dictionaries
 
     Returns:
-        dict: Failures grouped by category
+        dict: Failures grouped by category, in order of first failure
     """
-    # TODO: Implement this function
-
-    raise NotImplementedError("TODO: Implement categorize_failures()")
+    categories = {}
+    for result in results:
+        if result["pass_fail"] == "PASS":
+            continue
+        test_case_id = result["test_case_id"]
+        match = re.match(r"vision_([a-z]+)", test_case_id)
+        category = match.group(1) if match else test_case_id.split("_")[0]
+        categories.setdefault(category, []).append(result)
+    return categories
 
 
 def main():
     """
     Main entry point for test runner.
 
-    TODO: Implement test runner logic
-    - Parse command-line arguments
-    - Load model
-    - Parse test plan
-    - Run all test cases
-    - Write results to RESULTS.md
-    - Print summary statistics
+    Loads the model at most once, and only if an output is missing from
+    the cache, runs the test plan on a pool of worker threads
+    (see run_test_cases), and writes RESULTS.md, including per-stage
+    latencies from utils.tracer.
     """
     parser = argparse.ArgumentParser(description="W17D4 Test Runner")
 
-    # TODO: Add arguments
-    # parser.add_argument("--test-plan", default="TEST_PLAN.md")
-    # parser.add_argument("--output", default="RESULTS.md")
-    # parser.add_argument("--model", default="openai/clip-vit-base-patch32")
+    parser.add_argument("--test-plan", default="TEST_PLAN.md")
+    parser.add_argument("--output", default="RESULTS.md")
+    parser.add_argument("--model", default="openai/clip-vit-base-patch32")
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help="Directory holding the test inputs")
+    parser.add_argument("--image-dir", help="Images indexed for CLIP search (default: DATA_DIR/images)")
+    parser.add_argument("--trace-output", help="Also save stage latencies as JSON")
+    parser.add_argument("--no-trace", action="store_true", help="Do not time pipeline stages")
+    parser.add_argument("--workers", type=int, default=4, help="Threads running test cases (sharing one model)")
+    parser.add_argument("--dtype", choices=["float32", "float16", "bfloat16"], help="Weight dtype")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help="On-disk cache of model outputs")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the model")
 
     args = parser.parse_args()
+    tracer.enabled = not args.no_trace
+    cache = None if args.no_cache else OutputCache(args.cache_dir)
+
+    # Split the cores between worker threads so their forward passes do not
+    # oversubscribe the CPU
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    torch.set_num_threads(max(1, cores // max(1, args.workers)))
 
-    # TODO: Implement test runner logic
-    print("TODO: Implement test runner")
+    # 1. Pick the model (loaded on the first cache miss)
+    track = model_track(args.model)
+    model = LazyModel(args.model, torch_dtype=getattr(torch, args.dtype) if args.dtype else None)
 
-    # Example structure:
-    # 1. Load model
     # 2. Parse test plan
-    # 3. Run each test case
-    # 4. Collect results
-    # 5. Write RESULTS.md
-    # 6. Print summary (X/Y passed, Z failures)
+    test_cases = parse_test_plan(args.test_plan, args.data_dir)
+    print(f"Loaded {len(test_cases)} test cases from {args.test_plan}")
+
+    embeddings = None
+    if track == "clip":
+        image_dir = args.image_dir or Path(args.data_dir) / "images"
+        embeddings = index_gallery(image_dir, model, cache=cache)
+        print(f"Indexed {len(embeddings[1])} images from {image_dir}")
+
+    # 3. Run all test cases
+    results = run_test_cases(test_cases, model, embeddings, num_workers=args.workers, cache=cache)
+    for result in results:
+        print(f"{result['pass_fail']}  {result['test_case_id']}: {result['actual_output']}")
+
+    # 4. Write RESULTS.md
+    trace = tracer.to_dict() if tracer.enabled else None
+    write_results(results, args.output, feature=FEATURES[track], trace=trace)
+    if args.trace_output and tracer.enabled:
+        tracer.write(args.trace_output)
+
+    # 5. Summary
+    passed = sum(result["pass_fail"] == "PASS" for result in results)
+    print(f"\n{passed}/{len(results)} passed, {len(results) - passed} failures. Results written to {args.output}")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Output cache: {stats['hits']} hits, {stats['misses']} misses ({args.cache_dir})")
+        if not loaded_models():
+            print("The model was not loaded: every output it could produce was cached")
 
 
 if __name__ == "__main__":